@@ -0,0 +1,44 @@
+"""Compare js_escape with the previous regular expression implementation.
+
+Run with: python benchmarks/bench_js_escape.py
+"""
+import timeit
+
+from hanabi import templateutils
+
+
+def regex_js_escape(value):
+    # The implementation js_escape used to have
+    if value:
+        def replace_js_pattern(match):
+            return templateutils.JS_ESCAPE_MAPPING[match.group(0)]
+        value = unicode(value)
+        value = templateutils.JS_REPLACEMENT_RE.sub(replace_js_pattern, value)
+    return value
+
+
+VALUES = [
+    ('plain word', 'Amsterdam'),
+    ('plain sentence', 'A longer sentence without any special characters ' * 4),
+    ('few escapes', 'He said "hello" to the world\n'),
+    ('many escapes', '</script>"\'\\\r\n' * 20),
+    ('unicode', u'Caf\xe9 "Le Monde" \u2013 </div>'),
+]
+
+
+def main(number=100000):
+    for name, value in VALUES:
+        assert templateutils.js_escape(value) == regex_js_escape(value)
+        memo = {}
+        results = []
+        for func in (lambda: regex_js_escape(value),
+                     lambda: templateutils.js_escape(value),
+                     lambda: templateutils.js_escape(value, memo)):
+            seconds = min(timeit.repeat(func, number=number, repeat=3))
+            results.append(seconds / number * 1e9)
+        print '%-16s regex %7.0f ns  js_escape %7.0f ns  memoized %7.0f ns' % (
+            (name,) + tuple(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Compare the available JSON encoder backends on representative payloads.
+
+Run with: python benchmarks/bench_json.py
+"""
+import datetime
+import timeit
+
+from hanabi import encoding
+
+
+def record(i):
+    return {'id': i,
+            'name': 'Item number %d' % i,
+            'description': u'A somewhat longer text with unicode: caf\xe9 ' * 3,
+            'price': i * 1.25,
+            'active': i % 2 == 0,
+            'tags': ['red', 'green', 'blue'],
+            'owner': {'name': 'Someone', 'email': 'someone@example.com'}}
+
+
+def nested(depth):
+    if depth == 0:
+        return {'leaf': True, 'values': range(5)}
+    return {'level': depth, 'children': [nested(depth - 1) for i in range(3)]}
+
+
+PAYLOADS = [
+    ('small object', record(1), 20000),
+    ('list of 1000 objects', [record(i) for i in range(1000)], 50),
+    ('nested 6 levels', nested(6), 50),
+    ('10000 numbers', [i * 0.5 for i in range(10000)], 100),
+    ('1000 datetimes', [datetime.datetime(2012, 1, 1, i % 24)
+                        for i in range(1000)], 100),
+]
+
+
+def main():
+    backends = encoding.available_backends()
+    print 'Backends (fastest first): %s' % ', '.join(backends)
+    for name, data, number in PAYLOADS:
+        print name
+        for backend in backends:
+            for sort_keys in (False, True):
+                encoder = encoding.get_encoder(backend, sort_keys=sort_keys)
+                seconds = min(timeit.repeat(
+                    lambda: encoder.encode(data), number=number, repeat=3))
+                print '    %-12s sort_keys=%-5s %10.1f us' % (
+                    backend, sort_keys, seconds / number * 1e6)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""Benchmark the full request pipeline of Hanabi applications.
+
+Requests are sent to the applications in-process through the WSGI interface,
+so no sockets are involved. Every scenario is warmed up first. Then the
+latency of every request is measured, which gives the throughput and latency
+percentiles. Allocations are measured with tracemalloc when it is available.
+On Python 2 the number of garbage collections of the youngest generation is
+reported instead; a collection happens after about 700 net allocations of
+container objects.
+
+Run with: python benchmarks/bench_pipeline.py
+Save the results: python benchmarks/bench_pipeline.py --save before.json
+Compare with them: python benchmarks/bench_pipeline.py --compare before.json
+
+When comparing, the exit status is 1 if the median latency of a scenario
+increased by more than `--tolerance` percent.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+
+from werkzeug.test import EnvironBuilder
+
+from hanabi import Application
+from hanabi.instrumentation import clock
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class WSGIExample(Application):
+    package = 'hanabi.examples.wsgi'
+
+
+class WerkzeugExample(Application):
+    package = 'hanabi.examples.werkzeug'
+
+
+class BenchApp(Application):
+    package = 'benchapp'
+
+
+class DebugBenchApp(BenchApp):
+    debug_mode = True
+
+
+class Scenario(object):
+    """A request that is sent to an application over and over again."""
+
+    def __init__(self, name, app_class, path, method='GET', headers=None,
+                 data=None, status=200):
+        self.name = name
+        self.app_class = app_class
+        self.path = path
+        self.method = method
+        self.headers = headers or {}
+        self.data = data
+        self.status = status
+
+    def setup(self, app):
+        """Prepare the scenario, e.g. by looking up an ETag."""
+
+    def environ(self):
+        return EnvironBuilder(self.path, method=self.method,
+                              headers=self.headers,
+                              data=self.data).get_environ()
+
+
+class ETagHit(Scenario):
+    """Revalidates a resource with the ETag of a previous response."""
+
+    def setup(self, app):
+        self.headers = {}
+        status, headers, body = call(app, self.environ())
+        self.headers = {'If-None-Match': dict(headers)['ETag']}
+
+
+SCENARIOS = [
+    Scenario('wsgi.index', WSGIExample, '/'),
+    Scenario('werkzeug.hello', WerkzeugExample, '/hello/world'),
+    Scenario('rest.list', BenchApp, '/items'),
+    Scenario('rest.get', BenchApp, '/items/12'),
+    ETagHit('rest.list.etag_hit', BenchApp, '/items', status=304),
+    ETagHit('rest.get.etag_hit', BenchApp, '/items/12', status=304),
+    Scenario('template.render', BenchApp, '/pages/page/welcome'),
+    Scenario('template.render.debug', DebugBenchApp, '/pages/page/welcome'),
+    Scenario('form.get', BenchApp, '/signup'),
+    Scenario('form.post', BenchApp, '/signup', method='POST',
+             data={'name': 'Someone', 'email': 'someone@example.com'}),
+    Scenario('form.post.invalid', BenchApp, '/signup', method='POST',
+             data={'name': 'S', 'email': 'someone'}),
+    Scenario('js_include', BenchApp, '/pages/scripts'),
+    Scenario('js_include.debug', DebugBenchApp, '/pages/scripts'),
+]
+
+
+def call(app, environ):
+    """Call a WSGI application and return the status, headers and body."""
+    response = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [status, headers]
+        return lambda data: None
+    app_iter = app(environ, start_response)
+    try:
+        body = ''.join(app_iter)
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+    return response[0], response[1], body
+
+
+def percentile(sorted_values, percentage):
+    index = int(round((len(sorted_values) - 1) * percentage / 100.0))
+    return sorted_values[index]
+
+
+def run_scenario(scenario, nr_of_requests, warmup):
+    app = scenario.app_class.create_app()
+    scenario.setup(app)
+    status = call(app, scenario.environ())[0]
+    if int(status.split()[0]) != scenario.status:
+        raise AssertionError('%s: expected status %d, got %s' % (
+            scenario.name, scenario.status, status))
+    for i in xrange(warmup):
+        call(app, scenario.environ())
+
+    # Build the environs up front, so only the application is measured
+    environs = [scenario.environ() for i in xrange(nr_of_requests)]
+    latencies = []
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    gc_callbacks = getattr(gc, 'callbacks', None)
+    collections = [0]
+    if gc_callbacks is not None:
+        def count_collections(phase, info):
+            if phase == 'start' and info['generation'] == 0:
+                collections[0] += 1
+        gc_callbacks.append(count_collections)
+    start_count = gc.get_count()
+    start = clock()
+    for environ in environs:
+        request_start = clock()
+        call(app, environ)
+        latencies.append(clock() - request_start)
+    total = clock() - start
+
+    result = {}
+    if tracemalloc is not None:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['allocated_peak_kb'] = peak / 1024.0
+    if gc_callbacks is not None:
+        gc_callbacks.remove(count_collections)
+        collections = collections[0]
+    else:
+        collections = estimate_collections(start_count, gc.get_count())
+    latencies.sort()
+    result.update({
+        'requests': nr_of_requests,
+        'seconds': total,
+        'requests_per_second': nr_of_requests / total,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'gc_per_1000_requests': collections * 1000.0 / nr_of_requests,
+    })
+    return result
+
+
+def estimate_collections(start_count, end_count):
+    """Estimate the number of youngest generation collections.
+
+    Python 2 has no hooks into the garbage collector. The generation 1 count
+    is increased by every collection of generation 0. It is reset by a
+    collection of generation 1, which increases the generation 2 count.
+    """
+    threshold1 = gc.get_threshold()[1]
+    collected = (end_count[1] - start_count[1] +
+                 (end_count[2] - start_count[2]) * (threshold1 + 1))
+    return max(collected, 0)
+
+
+def environment():
+    info = {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    try:
+        info['commit'] = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def compare(old, new, tolerance):
+    """Print the differences between two results and return the regressions.
+    """
+    regressions = []
+    print '%-24s %10s %10s %8s %10s %10s' % (
+        'scenario', 'old p50', 'new p50', 'change', 'old req/s', 'new req/s')
+    for name in sorted(new['scenarios']):
+        current = new['scenarios'][name]
+        previous = old['scenarios'].get(name)
+        if previous is None:
+            print '%-24s %10s %10.3f' % (name, '-', current['p50_ms'])
+            continue
+        change = (current['p50_ms'] / previous['p50_ms'] - 1) * 100
+        flag = ''
+        if change > tolerance:
+            flag = ' REGRESSION'
+            regressions.append(name)
+        print '%-24s %10.3f %10.3f %+7.1f%% %10.0f %10.0f%s' % (
+            name, previous['p50_ms'], current['p50_ms'], change,
+            previous['requests_per_second'], current['requests_per_second'],
+            flag)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the Hanabi request pipeline.')
+    parser.add_argument('-n', '--requests', type=int, default=2000,
+                        help='number of measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=200,
+                        help='number of requests before measuring')
+    parser.add_argument('-s', '--scenario', action='append',
+                        help='only run scenarios starting with this name')
+    parser.add_argument('--save', help='write the results to a JSON file')
+    parser.add_argument('--compare', help='compare with a saved JSON file')
+    parser.add_argument('--tolerance', type=float, default=10.0,
+                        help='allowed increase of the median in percent')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    results = {'scenarios': {}}
+    print '%-24s %10s %8s %8s %8s %8s' % (
+        'scenario', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'gc/1000')
+    for scenario in SCENARIOS:
+        if args.scenario and not scenario.name.startswith(tuple(args.scenario)):
+            continue
+        result = run_scenario(scenario, args.requests, args.warmup)
+        results['scenarios'][scenario.name] = result
+        print '%-24s %10.0f %8.3f %8.3f %8.3f %8.1f' % (
+            scenario.name, result['requests_per_second'], result['p50_ms'],
+            result['p90_ms'], result['p99_ms'],
+            result['gc_per_1000_requests'])
+
+    results['environment'] = environment()
+    if args.save:
+        with open(args.save, 'w') as fileobj:
+            json.dump(results, fileobj, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as fileobj:
+            old = json.load(fileobj)
+        print
+        if compare(old, results, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
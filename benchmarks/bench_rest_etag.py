@@ -0,0 +1,51 @@
+"""Compare the single pass ETag pipeline with the previous double traversal.
+
+Run with: python benchmarks/bench_rest_etag.py
+"""
+import hashlib
+import json
+import timeit
+
+from werkzeug.test import EnvironBuilder
+
+from hanabi import RESTController
+
+
+class App(object):
+    version = '1.0'
+
+
+def legacy_response(data, version='1.0'):
+    # What RESTController.response used to do: hash the string
+    # representation and encode the data separately.
+    hash = hashlib.md5(version)
+    hash.update(str(data))
+    return hash.hexdigest(), json.JSONEncoder().encode(data)
+
+
+def make_payload(nr_of_items):
+    return [{'id': i,
+             'name': 'Item number %d' % i,
+             'tags': ['red', 'green', 'blue'],
+             'price': i * 1.25,
+             'owner': {'name': 'Someone', 'email': 'someone@example.com'}}
+            for i in range(nr_of_items)]
+
+
+def main():
+    controller = RESTController(App())
+    request = EnvironBuilder().get_request()
+    for nr_of_items in (100, 10000, 50000):
+        data = make_payload(nr_of_items)
+        size = len(controller.data_encoder.encode(data))
+        number = max(1, 200000 // nr_of_items)
+        legacy = min(timeit.repeat(
+            lambda: legacy_response(data), number=number, repeat=3))
+        current = min(timeit.repeat(
+            lambda: controller.response(request, data), number=number, repeat=3))
+        print '%6d items (%8d bytes): legacy %8.2f ms, single pass %8.2f ms' % (
+            nr_of_items, size, legacy / number * 1000, current / number * 1000)
+
+
+if __name__ == '__main__':
+    main()
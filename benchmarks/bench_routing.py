@@ -0,0 +1,81 @@
+"""Compare the route table against the original path splitting logic.
+
+Run with: python benchmarks/bench_routing.py
+"""
+import timeit
+
+from hanabi.routing import RouteTable
+
+
+def legacy_resolve(controllers, path_info):
+    # The lookup as it was done in Application.__call__
+    request_path = '/' + path_info.lstrip('/')
+    parts = request_path.split('/', 3)
+    nr_of_parts = len(parts)
+    remaining_path = ''
+    if nr_of_parts == 2:
+        module_name = parts[1]
+        controller_name = 'index'
+    elif nr_of_parts == 3:
+        module_name, controller_name = parts[1:]
+    else:
+        module_name, controller_name, remaining_path = parts[1:]
+
+    if module_name == '':
+        module_name = 'index'
+
+    try:
+        controller = controllers[(module_name, controller_name)]
+    except KeyError:
+        if controller_name != 'index':
+            controller = controllers[(module_name, 'index')]
+            remaining_path = controller_name + '/' + remaining_path
+        else:
+            raise
+
+    args = []
+    if remaining_path:
+        args.append(remaining_path)
+    return controller, args
+
+
+def make_controllers(nr_of_modules=50):
+    controllers = {}
+    for i in range(nr_of_modules):
+        for classname in ('index', 'list', 'page', 'edit'):
+            controllers[('module%d' % i, classname)] = object()
+    controllers[('index', 'index')] = object()
+    return controllers
+
+
+PATHS = ['/', '/module3', '/module7/list', '/module12/page/45/edit',
+         '/module20/1234', '/module42/edit/12']
+
+
+def main(number=100000):
+    controllers = make_controllers()
+    routes = RouteTable(controllers)
+    uncached = RouteTable(controllers, cache_size=1)
+
+    def run_legacy():
+        for path in PATHS:
+            legacy_resolve(controllers, path)
+
+    def run_uncached():
+        for path in PATHS:
+            uncached._resolve(path)
+
+    def run_cached():
+        for path in PATHS:
+            routes.resolve(path)
+
+    for name, func in [('legacy', run_legacy),
+                       ('route table (parse)', run_uncached),
+                       ('route table (cached)', run_cached)]:
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        per_call = seconds / (number * len(PATHS)) * 1e9
+        print '%-22s %8.1f ns/path' % (name, per_call)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+"""A small application used by the benchmarks in bench_pipeline.py."""
+__version__ = '1.0'
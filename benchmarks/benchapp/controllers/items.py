@@ -0,0 +1,25 @@
+from hanabi import RESTController
+
+
+ITEMS = dict((str(i), {'id': i,
+                       'name': 'Item number %d' % i,
+                       'tags': ['red', 'green', 'blue'],
+                       'price': i * 1.25,
+                       'owner': {'name': 'Someone',
+                                 'email': 'someone@example.com'}})
+             for i in range(100))
+
+
+class Index(RESTController):
+
+    def collection_version(self, request):
+        return len(ITEMS)
+
+    def resource_version(self, request, id):
+        return id
+
+    def list(self, request):
+        return [ITEMS[str(i)] for i in range(len(ITEMS))]
+
+    def get(self, request, id):
+        return ITEMS[id]
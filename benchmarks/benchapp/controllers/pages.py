@@ -0,0 +1,14 @@
+from hanabi import TemplateController
+
+
+class Page(TemplateController):
+
+    def index(self, request, name='home'):
+        return {'title': name.title(),
+                'rows': [{'id': i, 'name': 'Row <%d>' % i} for i in range(50)]}
+
+
+class Scripts(TemplateController):
+
+    def index(self, request):
+        return {}
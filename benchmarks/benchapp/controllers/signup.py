@@ -0,0 +1,22 @@
+from wtforms import Form, TextField, validators
+
+from hanabi import FormController
+
+
+class SignupForm(Form):
+    name = TextField('Name', [validators.Length(min=2, max=40)])
+    email = TextField('Email', [validators.Email()])
+
+
+class Index(FormController):
+
+    def form(self, request):
+        return SignupForm(request.form)
+
+    def view(self, request, form):
+        return {'form': form}
+
+    def process(self, request, form):
+        if form.validate():
+            return {'form': form, 'done': True}
+        return {'form': form}
@@ -0,0 +1,4 @@
+// Helpers used by the benchmark pages
+function greet(name) {
+    return 'Hello ' + name + '!';
+}
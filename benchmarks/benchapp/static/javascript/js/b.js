@@ -0,0 +1,2 @@
+// Renders the greeting
+document.title = greet('benchmark');
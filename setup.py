@@ -5,4 +5,6 @@ setup(
     package_dir={'': 'src'},
     packages = find_packages('src'),
     install_requires = ['Werkzeug', 'WTForms', 'Jinja2'],
+    # simplejson sorts keys natively, see encoding.get_canonical_encoder
+    extras_require = {'speedups': ['simplejson']},
 )
@@ -7,19 +7,18 @@ import tempfile
 from glob import glob
 from werkzeug import Response
 from .request import Request
+from .routing import RouteTable, LazyControllers
+from .server import PreforkServer
+from .static import StaticFiles, Fingerprints
 from werkzeug.exceptions import HTTPException
 from werkzeug.serving import run_simple
 from werkzeug.debug import DebuggedApplication
 from werkzeug.wsgi import SharedDataMiddleware
 from jinja2 import Environment, PackageLoader, FileSystemBytecodeCache
 
+from . import manifest
 from . import templateutils
-
-
-# /wiki => wiki.py Index.index
-# /wiki/12 => wiki.py Index.index(12)
-# /wiki/list => wiki.py List.index
-# /wiki/page/45/edit => wiki.py Page.index(45/edit)
+from .instrumentation import TIMINGS_KEY, clock
 
 def guess_autoescape(template_name):
     """Called by Jinja2 to enable auto escaping."""
@@ -40,29 +39,61 @@ class WSGIController(object):
         pass
 
 
+def controller_kind(cls):
+    """Return the dotted name of the base class a controller builds on.
+
+    This is the first base class that is defined outside of the controller's
+    own module, e.g. `hanabi.rest.RESTController`.
+    """
+    for base in cls.__mro__[1:]:
+        if base.__module__ != cls.__module__:
+            return '%s.%s' % (base.__module__, base.__name__)
+
+
 class Application(object):
     controller_module = '.controllers'
     package = None
     debug_mode = False
+    route_cache_size = 1024
+    lazy_controllers = False
+    prewarm_controllers = ()
+    controller_manifest = None
+    template_cache_dir = None
+    serve_static = True
+    instrumentation = None
 
     def __init__(self):
-        self.controllers = {}
+        if self.lazy_controllers:
+            self.controllers = LazyControllers(self.load_controller_module)
+        else:
+            self.controllers = {}
+        self.routes = RouteTable(self.controllers, self.route_cache_size)
+        self._manifest_modules = {}
         # Setup the template loader with some defaults
-        tmp = os.path.join(tempfile.gettempdir(), self.package + '-template-cache')
-        if not os.path.exists(tmp):
-            os.mkdir(tmp)
+        template_cache = self.template_cache_path
+        if not os.path.exists(template_cache):
+            os.makedirs(template_cache)
         self.templates = Environment(
             loader=PackageLoader(self.package, 'templates'),
-            bytecode_cache=FileSystemBytecodeCache(),
+            bytecode_cache=FileSystemBytecodeCache(template_cache),
             autoescape=guess_autoescape,
             extensions=['jinja2.ext.autoescape'])
         self.templates.globals.update(
             js_include=templateutils.JavascriptInclude(self),
+            css_include=templateutils.StylesheetInclude(self),
+            image_tag=templateutils.ImageTag(self),
+            favicon_link_tag=templateutils.FaviconLink(self),
             url_for=templateutils.URLFor(self))
         self.templates.filters['js_escape'] = templateutils.js_escape
 
         self.version = self._find_version()
 
+        static_dir = os.path.join(self.package_dir, 'static')
+        self.fingerprints = Fingerprints(static_dir)
+        self.static_files = None
+        if self.serve_static:
+            self.static_files = StaticFiles(static_dir, self.fingerprints)
+
     def _find_version(self):
         package = importlib.import_module(self.package)
         try:
@@ -76,42 +107,63 @@ class Application(object):
         package = importlib.import_module(self.package)
         return os.path.abspath(os.path.dirname(package.__file__))
 
+    @property
+    def template_cache_path(self):
+        """The directory holding the compiled templates.
+
+        This is `template_cache_dir` relative to the package directory. By
+        default a directory in the system's temporary directory is used.
+        """
+        if self.template_cache_dir is None:
+            return os.path.join(tempfile.gettempdir(), self.package + '-template-cache')
+        return os.path.join(self.package_dir, self.template_cache_dir)
+
+    def precompile_templates(self):
+        """Compile all HTML and JS templates into the template cache.
+
+        Run this at build or deploy time to avoid compiling templates on the
+        first requests after a deploy. Point `template_cache_dir` to a
+        directory that is deployed together with the package. Cached templates
+        are keyed on their file path, so the package must be installed at the
+        same path where the templates were compiled.
+
+        Returns the names of the compiled templates.
+        """
+        names = list(self.templates.list_templates(
+            filter_func=lambda name: name.endswith(('.html', '.js'))))
+        for name in names:
+            self.templates.get_template(name)
+        return names
+
     def __call__(self, environ, start_response):
+        if self.instrumentation is not None:
+            return self.instrumentation(self.handle, environ, start_response,
+                                        timing_header=self.debug_mode)
+        return self.handle(environ, start_response)
+
+    def handle(self, environ, start_response):
         # No extra trailing slashes allowed
         path_info = environ.get('PATH_INFO', '')
         if path_info != '/' and path_info.endswith('/'):
             return self.redirect(start_response, path_info.rstrip('/'))
 
-        # Create the keys for our controller lookup
-        request_path = '/' + path_info.lstrip('/')
-        parts = request_path.split('/', 3)
-        nr_of_parts = len(parts)
-        remaining_path = ''
-        if nr_of_parts == 2:
-            module_name = parts[1]
-            controller_name = 'index'
-        elif nr_of_parts == 3:
-            module_name, controller_name = parts[1:]
-        else:
-            module_name, controller_name, remaining_path = parts[1:]
-
-        # Default to the index module for root level access
-        if module_name == '':
-            module_name = 'index'
+        if path_info.startswith('/static/') and self.static_files is not None:
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + '/static'
+            environ['PATH_INFO'] = path_info[len('/static'):]
+            return self.static_files(environ, start_response)
 
+        timings = environ.get(TIMINGS_KEY)
+        if timings is None:
+            controller, args = self.routes.resolve(path_info)
+            return controller(environ, start_response, *args)
+        start = clock()
+        controller, args = self.routes.resolve(path_info)
+        resolved = clock()
+        timings.append(('routing', resolved - start))
         try:
-            controller = self.controllers[(module_name, controller_name)]
-        except KeyError:
-            if controller_name != 'index':
-                controller = self.controllers[(module_name, 'index')]
-                remaining_path = controller_name + '/' + remaining_path
-            else:
-                raise
-
-        args = []
-        if remaining_path:
-            args.append(remaining_path)
-        return controller(environ, start_response, *args)
+            return controller(environ, start_response, *args)
+        finally:
+            timings.append(('dispatch', clock() - resolved))
 
     def redirect(self, start_response, path):
         start_response('302 Found', [('Location', path)])
@@ -128,11 +180,24 @@ class Application(object):
         if modulename == 'static':
             raise ValueError('Modulename: "%s" is reserved.' % modulename)
         self.controllers[(modulename, classname.lower())] = cls(app=self)
+        self.routes.clear()
 
-    def configure_controllers(self):
+    @property
+    def controller_dir(self):
         controllers_module = importlib.import_module(self.controller_module, package=self.package)
-        controller_dir = os.path.dirname(controllers_module.__file__)
+        return os.path.dirname(controllers_module.__file__)
 
+    @property
+    def controller_manifest_path(self):
+        if self.controller_manifest is None:
+            return None
+        return os.path.join(self.package_dir, self.controller_manifest)
+
+    def find_controller_modules(self):
+        """Return the names of all modules in the controllers package."""
+        controller_dir = self.controller_dir
+
+        modulenames = []
         for controller_file in os.listdir(controller_dir):
             if not controller_file.endswith('.py'):
                 continue
@@ -141,18 +206,113 @@ class Application(object):
                 raise ValueError(
                     'A controller module cannot be named static '
                     'since that would clash with static file serving.')
-            print controller_modulename
+            logging.debug('Found controller module: %s', controller_modulename)
             if controller_modulename.startswith('__'):
                 continue
-            controller_module = importlib.import_module(
-                '%s.%s' % (self.controller_module, controller_modulename),
-                package=self.package)
-            print 'Scanning module:', controller_modulename
-            for obj_name in dir(controller_module):
-                obj = getattr(controller_module, obj_name)
-                if isinstance(obj, type) and issubclass(obj, WSGIController) and obj.__module__ == controller_module.__name__:
-                    print 'Added controller:', obj_name
-                    self.register_controller(controller_modulename, obj_name, obj)
+            modulenames.append(controller_modulename)
+        return modulenames
+
+    def find_controllers(self, controller_module):
+        """Return `(name, class)` pairs of controllers defined in a module."""
+        logging.debug('Scanning module: %s', controller_module.__name__)
+        controllers = []
+        for obj_name in dir(controller_module):
+            obj = getattr(controller_module, obj_name)
+            if isinstance(obj, type) and issubclass(obj, WSGIController) and obj.__module__ == controller_module.__name__:
+                controllers.append((obj_name, obj))
+        return controllers
+
+    def import_controller_module(self, controller_modulename):
+        return importlib.import_module(
+            '%s.%s' % (self.controller_module, controller_modulename),
+            package=self.package)
+
+    def load_controller_module(self, controller_modulename):
+        """Import a controller module and register all its controllers.
+
+        When the module is listed in the controller manifest the classes are
+        taken from there instead of scanning the module.
+        """
+        controller_module = self.import_controller_module(controller_modulename)
+        try:
+            classnames = self._manifest_modules[controller_modulename]
+        except KeyError:
+            controllers = self.find_controllers(controller_module)
+        else:
+            controllers = [(obj_name, getattr(controller_module, obj_name))
+                           for obj_name in classnames]
+        for obj_name, obj in controllers:
+            logging.debug('Added controller: %s', obj_name)
+            self.register_controller(controller_modulename, obj_name, obj)
+
+    def build_controller_manifest(self):
+        """Scan the controllers package and write the controller manifest.
+
+        The manifest records the controller modules, their classes and the
+        kind of each controller. It is meant to be generated at build or
+        deploy time. At startup `configure_controllers` uses it instead of
+        scanning the package, as long as none of the scanned files changed.
+        """
+        path = self.controller_manifest_path
+        if path is None:
+            raise ValueError('No controller_manifest configured for: %s' %
+                             self.package)
+        controller_dir = self.controller_dir
+        signatures = {'.': manifest.file_signature(controller_dir)}
+        modules = {}
+        for controller_modulename in self.find_controller_modules():
+            controller_module = self.import_controller_module(controller_modulename)
+            module_file = controller_modulename + '.py'
+            signatures[module_file] = manifest.file_signature(
+                os.path.join(controller_dir, module_file))
+            modules[controller_modulename] = dict(
+                (obj_name, controller_kind(obj))
+                for obj_name, obj in self.find_controllers(controller_module))
+        manifest.write_manifest(path, {
+            'signatures': signatures,
+            'modules': modules})
+
+    def read_controller_manifest(self):
+        """Return the modules recorded in an up to date controller manifest.
+
+        Returns None when no manifest is configured, it does not exist or it
+        is stale.
+        """
+        path = self.controller_manifest_path
+        if path is None:
+            return None
+        data = manifest.read_manifest(path)
+        if data is None:
+            return None
+        if not manifest.is_fresh(self.controller_dir, data['signatures']):
+            logging.warning('Ignoring stale controller manifest: %s' % path)
+            return None
+        return data['modules']
+
+    def configure_controllers(self):
+        """Register the controllers found in the controllers package.
+
+        With `lazy_controllers` enabled only the module names are recorded.
+        A module is imported and its controllers are instantiated when one of
+        them is first looked up. The modules listed in `prewarm_controllers`
+        are loaded right away, which allows pre-forking servers to share them
+        between workers.
+        """
+        manifest_modules = self.read_controller_manifest()
+        if manifest_modules is None:
+            modulenames = self.find_controller_modules()
+        else:
+            self._manifest_modules = manifest_modules
+            modulenames = manifest_modules.keys()
+
+        for controller_modulename in modulenames:
+            if self.lazy_controllers:
+                self.controllers.pending.add(controller_modulename)
+            else:
+                self.load_controller_module(controller_modulename)
+        if self.lazy_controllers:
+            for controller_modulename in self.prewarm_controllers:
+                self.controllers.load(controller_modulename)
 
     @classmethod
     def create_app(cls, **config):
@@ -170,18 +330,57 @@ class Application(object):
         })
         run_simple('localhost', 8080, DebuggedApplication(app, evalex=True), use_reloader=True)
 
+    @classmethod
+    def run_production(cls, host='127.0.0.1', port=8000, workers=None,
+                       threads=1, max_requests=0, queue_size=None,
+                       request_timeout=30, **config):
+        """Serve the application with a pre-fork server.
+
+        The application is created once in the master process and shared by
+        the workers. Every worker handles requests with `threads` threads.
+        Requests that find the queue of a worker full are answered with a
+        503 response. Connections without progress for `request_timeout`
+        seconds are closed. See `hanabi.server` for the signals it handles.
+        """
+        server = PreforkServer(lambda: cls.create_app(**config), host, port,
+                               workers=workers, threads=threads,
+                               max_requests=max_requests,
+                               queue_size=queue_size,
+                               request_timeout=request_timeout)
+        server.run()
+
 
 class Controller(WSGIController):
+    """Base class for controllers that work with request and response objects.
+
+    Responses can be cached on the server by setting `response_cache` to a
+    `hanabi.caching.ResponseCache`.
+
+    There is one instance of every controller. It handles all requests, also
+    from several threads at once. So keep the state of a request in the
+    request object or in local variables, never in attributes of the
+    controller. The caches of the application and its helpers are thread
+    safe.
+    """
+    response_cache = None
 
     def dispatch(self, request, *args, **kwargs):
         return self.index(request)
 
-    def __call__(self, environ, start_response, *args, **kwargs):
-        request = Request(environ)
+    def respond(self, request, *args, **kwargs):
+        """Dispatch the request and return a response object."""
         try:
             response = self.dispatch(request, *args, **kwargs)
         except HTTPException, e:
-            response = e.get_response(environ)
+            response = e.get_response(request.environ)
         if isinstance(response, basestring):
             response = Response(response, content_type='text/html')
+        return response
+
+    def __call__(self, environ, start_response, *args, **kwargs):
+        request = Request(environ)
+        if self.response_cache is None:
+            response = self.respond(request, *args, **kwargs)
+        else:
+            response = self.response_cache(self, request, *args, **kwargs)
         return response(environ, start_response)
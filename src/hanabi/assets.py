@@ -0,0 +1,76 @@
+#-*- x-counterpart: ../../tests/test_assets.py; -*-
+"""Build static asset bundles ahead of time.
+
+Templates include resources with helpers such as `js_include('a.js',
+'b.js')`. `build_assets` finds these calls in all templates, builds the
+bundles and records them in a manifest in the `static/_cache` directory. At
+runtime the helpers only look the bundles up in that manifest. The
+fingerprints of all other static files are computed as well. Run it at build
+or deploy time:
+
+    from hanabi import assets
+    assets.build_assets(MyApp())
+"""
+import os
+
+from jinja2 import nodes
+
+from . import manifest
+from .templateutils import ResourceHelper, MANIFEST_NAME
+
+
+def resource_helpers(environment):
+    """Return the resource helpers available to templates by name."""
+    return dict((name, helper)
+                for name, helper in environment.globals.iteritems()
+                if isinstance(helper, ResourceHelper))
+
+
+def find_bundles(environment):
+    """Find the resources included by templates.
+
+    Returns a set of `(helper name, resources)` tuples. Only calls with
+    constant arguments can be found. Other bundles are still built when they
+    are first requested.
+    """
+    helpers = resource_helpers(environment)
+    bundles = set()
+    for template_name in environment.list_templates(
+            filter_func=lambda name: name.endswith(('.html', '.js'))):
+        source = environment.loader.get_source(environment, template_name)[0]
+        tree = environment.parse(source, template_name)
+        for call in tree.find_all(nodes.Call):
+            if not isinstance(call.node, nodes.Name):
+                continue
+            if call.node.name not in helpers:
+                continue
+            if call.kwargs or call.dyn_args or call.dyn_kwargs:
+                continue
+            if not all(isinstance(arg, nodes.Const) for arg in call.args):
+                continue
+            bundles.add((call.node.name,
+                         tuple(arg.value for arg in call.args)))
+    return bundles
+
+
+def build_assets(app, bundles=(), minify=True, compress=True):
+    """Build the bundles used by the app's templates and write a manifest.
+
+    Extra bundles which cannot be found in the templates can be passed as
+    `(helper name, resources)` tuples. By default the bundles are minified
+    and a gzipped copy is stored next to each of them. The fingerprints of
+    the static files are written as well. Returns the manifest data.
+    """
+    helpers = resource_helpers(app.templates)
+    data = {}
+    for name, resources in find_bundles(app.templates) | set(bundles):
+        helper = helpers[name]
+        urls = [helper.build_bundle(resources, minify, compress)]
+        data.setdefault(helper.resource_type, {})[','.join(resources)] = urls
+    cache_dir = os.path.join(app.package_dir, 'static', '_cache')
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    manifest.write_manifest(os.path.join(cache_dir, MANIFEST_NAME),
+                            {'bundles': data})
+    app.fingerprints.build()
+    return data
@@ -1,3 +1,16 @@
+#-*- x-counterpart: ../../tests/test_caching.py; -*-
+import collections
+import hashlib
+import marshal
+import os
+import threading
+import time
+
+from werkzeug import Response
+
+from . import manifest
+
+
 def conditional_get(controller, response):
     """Require that the client revalidates."""
     response.headers['Cache-Control'] = 'must-revalidate'
@@ -12,3 +25,226 @@ def no_store(controller, response):
     """
     response.headers['Cache-Control'] = 'no-store'
     return response
+
+
+class MemoryBackend(object):
+    """Stores cached responses in the memory of the current process.
+
+    The least recently used entries are evicted once there are more than
+    `max_entries` entries or their bodies take more than `max_bytes`.
+
+    Backends store entries under a string key for `ttl` seconds. An entry is
+    a `(status, headers, body)` tuple. Other backends need to provide the
+    same `get`, `set`, `delete` and `clear` methods, which may be called from
+    several threads at once.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, entry = self._entries.pop(key)
+            except KeyError:
+                return None
+            if expires < time.time():
+                self.size -= len(entry[2])
+                return None
+            self._entries[key] = (expires, entry)
+            return entry
+
+    def set(self, key, entry, ttl):
+        with self._lock:
+            self._delete(key)
+            self._entries[key] = (time.time() + ttl, entry)
+            self.size += len(entry[2])
+            while (len(self._entries) > self.max_entries or
+                   self.size > self.max_bytes):
+                expires, evicted = self._entries.popitem(last=False)[1]
+                self.size -= len(evicted[2])
+
+    def delete(self, key):
+        with self._lock:
+            self._delete(key)
+
+    def _delete(self, key):
+        try:
+            expires, entry = self._entries.pop(key)
+        except KeyError:
+            return
+        self.size -= len(entry[2])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class FileBackend(object):
+    """Stores cached responses as files in a directory.
+
+    Since the directory can be shared, all worker processes on a machine use
+    the same cache. Entries are written to a temporary file first and then
+    renamed, so readers never see partially written entries. They are stored
+    with `marshal`, which unlike pickle cannot run code when an entry is
+    loaded, so entries may only contain strings, numbers, lists and tuples.
+
+    The modification time of an entry file is set to the time it expires.
+    Every `prune_interval` seconds `set` removes the expired entries. When
+    there are still more than `max_entries` entries or they take more than
+    `max_bytes`, the entries that expire first are removed too.
+    """
+
+    def __init__(self, directory, max_entries=10000,
+                 max_bytes=256 * 1024 * 1024, prune_interval=60):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self._next_prune = time.time() + prune_interval
+        self._lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as entry_file:
+                expires, entry = marshal.loads(entry_file.read())
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        if expires < time.time():
+            self._remove(path)
+            return None
+        return entry
+
+    def set(self, key, entry, ttl):
+        expires = time.time() + ttl
+        path = self._path(key)
+        manifest.write_file(path, marshal.dumps((expires, entry)))
+        try:
+            os.utime(path, (expires, expires))
+        except OSError:
+            pass
+        with self._lock:
+            prune = self._next_prune <= time.time()
+            if prune:
+                self._next_prune = time.time() + self.prune_interval
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Remove expired entries and enforce the size limits."""
+        now = time.time()
+        entries = []
+        for filename in os.listdir(self.directory):
+            # Skip entries that are being written
+            if filename.startswith(manifest.TEMP_PREFIX):
+                continue
+            path = self._path(filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_mtime < now:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        # Keep the entries that expire last
+        entries.sort(reverse=True)
+        count = size = 0
+        for expires, entry_size, path in entries:
+            count += 1
+            size += entry_size
+            if count > self.max_entries or size > self.max_bytes:
+                self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def clear(self):
+        for filename in os.listdir(self.directory):
+            self.delete(filename)
+
+
+class ResponseCache(object):
+    """Caches complete responses of a controller on the server.
+
+    Set an instance as the `response_cache` of a controller to use it:
+
+        class Page(TemplateController):
+            response_cache = ResponseCache(ttl=300, vary=('Accept',))
+
+    Only successful GET and HEAD requests are cached. The cache key is derived
+    from the app version, the path and query string, the controller arguments
+    and the request headers listed in `vary`. These headers are added to the
+    `Vary` header of the responses, so other caches keep them apart too.
+    Responses that are streamed, set cookies or forbid storing are never
+    cached.
+
+    Cached responses still honor conditional requests. A matching
+    `If-None-Match` results in a 304.
+    """
+
+    def __init__(self, ttl=60, vary=(), backend=None):
+        self.ttl = ttl
+        self.vary = tuple(vary)
+        if backend is None:
+            backend = MemoryBackend()
+        self.backend = backend
+
+    def key(self, controller, request, *args, **kwargs):
+        """Return the cache key for a request."""
+        environ = request.environ
+        hash = hashlib.sha1(str(controller.app.version))
+        hash.update(controller.__class__.__module__)
+        hash.update(controller.__class__.__name__)
+        hash.update(repr((environ.get('PATH_INFO', ''),
+                          environ.get('QUERY_STRING', ''),
+                          args, sorted(kwargs.items()))))
+        for header in self.vary:
+            hash.update(repr(request.headers.get(header)))
+        return hash.hexdigest()
+
+    def is_cacheable(self, response):
+        if response.status_code != 200 or response.is_streamed:
+            return False
+        if 'Set-Cookie' in response.headers:
+            return False
+        cache_control = response.headers.get('Cache-Control', '')
+        return 'no-store' not in cache_control and 'private' not in cache_control
+
+    def __call__(self, controller, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return controller.respond(request, *args, **kwargs)
+
+        key = self.key(controller, request, *args, **kwargs)
+        entry = self.backend.get(key)
+        if entry is None:
+            response = controller.respond(request, *args, **kwargs)
+            if self.vary:
+                response.vary.update(self.vary)
+            if not self.is_cacheable(response):
+                return response
+            entry = (response.status, list(response.headers),
+                     response.get_data())
+            self.backend.set(key, entry, self.ttl)
+            return response
+
+        status, headers, body = entry
+        response = Response(body, status=status, headers=headers)
+        return response.make_conditional(request)
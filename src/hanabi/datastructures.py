@@ -0,0 +1,79 @@
+#-*- x-counterpart: ../../tests/test_datastructures.py; -*-
+import threading
+
+class LRUCache(object):
+    """A bounded mapping that discards the least recently used items.
+
+    Items are kept in two generations. New and recently used items live in the
+    young generation. Once it is full it becomes the old generation and the
+    previous old generation is dropped. Items that are used while they are in
+    the old generation are promoted again. This approximates LRU eviction
+    while keeping a cache hit as cheap as a single dict lookup.
+
+    At most `capacity` items are stored.
+
+    The cache is thread safe. Hits in the young generation do not take a
+    lock; everything that changes the generations does.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._generation_size = max(1, capacity // 2)
+        self._young = {}
+        self._old = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        try:
+            return self._young[key]
+        except KeyError:
+            return self._promote(key)
+
+    def _promote(self, key):
+        with self._lock:
+            # Another thread may have promoted the item in the meantime
+            try:
+                return self._young[key]
+            except KeyError:
+                value = self._old.pop(key)
+            self._set(key, value)
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        self._old.pop(key, None)
+        young = self._young
+        young[key] = value
+        if len(young) >= self._generation_size:
+            self._old = young
+            self._young = {}
+
+    def __delitem__(self, key):
+        with self._lock:
+            if self._young.pop(key, self) is self:
+                del self._old[key]
+
+    def __contains__(self, key):
+        return key in self._young or key in self._old
+
+    def __len__(self):
+        return len(self._young) + len(self._old)
+
+    def get(self, key, default=None):
+        young = self._young
+        if key in young:
+            return young[key]
+        if key in self._old:
+            try:
+                return self._promote(key)
+            except KeyError:
+                pass
+        return default
+
+    def clear(self):
+        with self._lock:
+            self._young = {}
+            self._old = {}
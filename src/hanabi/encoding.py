@@ -0,0 +1,114 @@
+#-*- x-counterpart: ../../tests/test_encoding.py; -*-
+"""Pluggable JSON encoder backends.
+
+Every backend follows the same contract. `encode(data)` returns a `str` (thus
+bytes) with the same layout as the standard library produces: ASCII only,
+`', '` and `': '` as separators and keys sorted only when `sort_keys` is set.
+Objects that are not supported by JSON are passed to the `default` hook. The
+default hook converts dates, times, decimals and UUIDs to strings.
+
+The fastest available backend is selected at import time. The standard
+library `json` module is always available as a fallback. Its C accelerator is
+not used when keys need to be sorted, which makes it several times slower. So
+for sorted output backends that sort natively are preferred.
+"""
+import datetime
+import decimal
+import json
+import uuid
+
+
+def default_hook(obj):
+    """Convert common Python types which have no JSON equivalent."""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    raise TypeError('%r is not JSON serializable' % (obj,))
+
+
+def stdlib_backend(sort_keys, default):
+    return json.JSONEncoder(sort_keys=sort_keys, default=default)
+
+
+def simplejson_backend(sort_keys, default):
+    import simplejson
+    # simplejson has its own encoding for some types. Disable it to produce
+    # the same output as the other backends.
+    return simplejson.JSONEncoder(
+        sort_keys=sort_keys, default=default, use_decimal=False,
+        namedtuple_as_object=False, tuple_as_array=True)
+
+
+# List of (priority, name, factory, sorts_natively) tuples
+_backends = []
+
+
+def register_backend(name, factory, priority=0, sorts_natively=True):
+    """Register an encoder backend.
+
+    `factory` is called with the `sort_keys` and `default` arguments and must
+    return an object with an `encode` method. It should raise an ImportError
+    when the backend is not available. Backends with a higher priority are
+    preferred. `sorts_natively` should be False for backends which become
+    much slower when sorting keys.
+    """
+    _backends[:] = [backend for backend in _backends if backend[1] != name]
+    _backends.append((priority, name, factory, sorts_natively))
+    _backends.sort(key=lambda backend: -backend[0])
+
+
+def available_backends():
+    """Return the names of the backends which can be used, fastest first."""
+    names = []
+    for priority, name, factory, sorts_natively in _backends:
+        try:
+            factory(False, default_hook)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_encoder(backend=None, sort_keys=False, default=default_hook):
+    """Return an encoder from the given backend.
+
+    Without a backend name the fastest available backend is used.
+    """
+    backends = _backends
+    if sort_keys:
+        backends = sorted(backends, key=lambda backend: not backend[3])
+    for priority, name, factory, sorts_natively in backends:
+        if backend is not None and name != backend:
+            continue
+        try:
+            return factory(sort_keys, default)
+        except ImportError:
+            if backend is not None:
+                raise
+    raise ValueError('No JSON encoder backend named: %s' % backend)
+
+
+def get_canonical_encoder(default=default_hook):
+    """Return an encoder that sorts keys when that is cheap.
+
+    With sorted keys equal data is always encoded the same way, also by
+    processes with different hash seeds. Sorting is only enabled when an
+    available backend sorts natively; otherwise the fastest encoder is
+    returned without sorting. Install the `speedups` extra (simplejson) to
+    get sorted keys.
+    """
+    for priority, name, factory, sorts_natively in _backends:
+        if not sorts_natively:
+            continue
+        try:
+            return factory(True, default)
+        except ImportError:
+            pass
+    return get_encoder(default=default)
+
+
+register_backend('json', stdlib_backend, priority=10, sorts_natively=False)
+register_backend('simplejson', simplejson_backend, priority=0)
+
+default_backend = available_backends()[0]
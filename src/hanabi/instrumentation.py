@@ -0,0 +1,177 @@
+#-*- x-counterpart: ../../tests/test_instrumentation.py; -*-
+"""Timing of the steps that are taken to handle a request.
+
+Set the `instrumentation` attribute of an application to enable it:
+
+    class MyApp(Application):
+        instrumentation = Instrumentation([HistogramSink(), StatsdSink()])
+
+While a request is handled the durations of the steps (spans) are collected
+in a list in the WSGI environ under `TIMINGS_KEY`. When the request is done
+the list is passed to all sinks. Code that wants to record a span checks for
+the list first, so there is next to no overhead without instrumentation:
+
+    timings = environ.get(TIMINGS_KEY)
+    if timings is not None:
+        start = clock()
+    ...
+    if timings is not None:
+        timings.append(('my.span', clock() - start))
+
+In debug mode the spans recorded before the response starts are also sent to
+the client in a `Server-Timing` header.
+"""
+import bisect
+import ctypes
+import ctypes.util
+import logging
+import socket
+import threading
+import time
+
+TIMINGS_KEY = 'hanabi.timings'
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _monotonic_clock():
+    """Return a monotonic clock function, falling back to `time.time`."""
+    try:
+        return time.monotonic
+    except AttributeError:
+        pass
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'libc.so.6')
+        clock_gettime = librt.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+    CLOCK_MONOTONIC = 1
+    if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(_timespec())) != 0:
+        return time.time
+
+    def monotonic():
+        timespec = _timespec()
+        clock_gettime(CLOCK_MONOTONIC, ctypes.byref(timespec))
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+    return monotonic
+
+clock = _monotonic_clock()
+
+
+def server_timing(timings):
+    """Format timings as the value of a `Server-Timing` header."""
+    return ', '.join('%s;dur=%.3f' % (name, duration * 1000)
+                     for name, duration in timings)
+
+
+class Instrumentation(object):
+    """Collects the timings of a request and passes them to the sinks."""
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+
+    def __call__(self, app, environ, start_response, timing_header=False):
+        timings = environ[TIMINGS_KEY] = []
+        start = clock()
+        if timing_header:
+            def timed_start_response(status, headers, exc_info=None):
+                header = server_timing(timings + [('total', clock() - start)])
+                headers = list(headers) + [('Server-Timing', header)]
+                return start_response(status, headers, exc_info)
+        else:
+            timed_start_response = start_response
+        try:
+            return app(environ, timed_start_response)
+        finally:
+            timings.append(('request', clock() - start))
+            for sink in self.sinks:
+                sink.emit(timings)
+
+
+class Histogram(object):
+    """Counts durations in buckets with the given upper bounds in seconds."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.counts[bisect.bisect_left(self.bounds, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def percentile(self, percentage):
+        """Return the upper bound of the bucket holding the percentile."""
+        if not self.count:
+            return None
+        rank = self.count * percentage / 100.0
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class HistogramSink(object):
+    """Keeps a histogram of the durations of every span in memory."""
+    bounds = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+              0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def emit(self, timings):
+        with self._lock:
+            for name, duration in timings:
+                try:
+                    histogram = self.histograms[name]
+                except KeyError:
+                    histogram = self.histograms[name] = Histogram(self.bounds)
+                histogram.add(duration)
+
+
+class LogSink(object):
+    """Logs the timings of every request as a single line."""
+
+    def __init__(self, logger='hanabi.timing', level=logging.INFO):
+        self.logger = logging.getLogger(logger)
+        self.level = level
+
+    def emit(self, timings):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, ' '.join(
+                '%s=%.3fms' % (name, duration * 1000)
+                for name, duration in timings))
+
+
+class StatsdSink(object):
+    """Sends the timings to a StatsD daemon over UDP.
+
+    The timings of a request are sent in a single packet. Sending never
+    blocks and errors are ignored, so a missing daemon does not affect the
+    application.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='hanabi'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(0)
+
+    def emit(self, timings):
+        packet = '\n'.join('%s.%s:%.3f|ms' % (self.prefix, name, duration * 1000)
+                           for name, duration in timings)
+        try:
+            self.socket.sendto(packet, self.address)
+        except socket.error:
+            pass
@@ -0,0 +1,96 @@
+#-*- x-counterpart: ../../tests/test_manifest.py; -*-
+"""Persistent manifests of things discovered at build time.
+
+A manifest is a JSON document that records the result of an expensive scan,
+for example the controllers found in a package. Every scanned file is stored
+with its signature (mtime and size) so a manifest can be validated with a
+few stat calls instead of repeating the scan.
+"""
+import contextlib
+import json
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def file_signature(path):
+    """Return a cheap signature for the file or directory at `path`."""
+    stat = os.stat(path)
+    return [stat.st_mtime, stat.st_size]
+
+
+def is_fresh(base_dir, signatures):
+    """Check a mapping of paths to signatures against the filesystem.
+
+    The paths are relative to `base_dir`. This keeps a manifest valid when
+    the files are moved to another location as long as their mtimes are
+    preserved.
+    """
+    for path, signature in signatures.iteritems():
+        try:
+            if file_signature(os.path.join(base_dir, path)) != signature:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def read_manifest(path):
+    """Read a manifest. Returns None when there is no manifest at `path`."""
+    try:
+        with open(path) as manifest_file:
+            return json.load(manifest_file)
+    except IOError:
+        return None
+
+
+# The prefix of the temporary files of `write_file`
+TEMP_PREFIX = '.tmp'
+
+
+def write_file(path, data, mode=0644):
+    """Atomically write data to a file.
+
+    The data is written to a temporary file in the same directory first.
+    Renaming it is atomic so other processes never see a partially written
+    file. The file gets `mode`, so processes running as other users can read
+    it.
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX,
+                                     dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(data)
+        os.chmod(temp_path, mode)
+        os.rename(temp_path, path)
+    except:
+        os.remove(temp_path)
+        raise
+
+
+def write_manifest(path, data):
+    """Atomically write a manifest to `path`."""
+    write_file(path, json.dumps(data, indent=1, sort_keys=True))
+
+
+@contextlib.contextmanager
+def locked(path):
+    """Hold an exclusive lock on the lock file at `path`.
+
+    Processes that update a shared manifest take this lock so no updates are
+    lost. Without `fcntl` no lock is taken; since manifests are written
+    atomically, readers still never see a partial manifest.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,166 @@
+#-*- x-counterpart: ../../tests/test_minify.py; -*-
+"""Conservative minification of static resources.
+
+The minifiers remove comments and collapse whitespace. They do not rename
+or reorder anything. Comments starting with `/*!` are kept since they
+usually contain license information. For Javascript line breaks are kept,
+which avoids problems with automatic semicolon insertion.
+"""
+
+# Characters after which a slash starts a regular expression literal
+REGEX_PRECEDERS = frozenset('(,=:[!&|?{;+-*%<>~^')
+# Keywords after which a slash starts a regular expression literal
+REGEX_KEYWORDS = frozenset(['return', 'typeof', 'case', 'do', 'else', 'in',
+                            'instanceof', 'new', 'throw', 'void', 'delete'])
+# Keywords whose parenthesized condition can be followed by a regular
+# expression literal, e.g. `if (ok) /a/.test(s)`
+CONDITION_KEYWORDS = frozenset(['if', 'while', 'for', 'with'])
+
+
+def _last_word(out):
+    """Return the keyword-like word at the end of the output or ''."""
+    tail = ''.join(out[-12:]).rstrip()
+    word = tail[len(tail.rstrip('abcdefghijklmnopqrstuvwxyz')):]
+    before = tail[:len(tail) - len(word)][-1:]
+    if before.isalnum() or before in ('_', '$'):
+        return ''
+    return word
+
+
+def _starts_regex(out, last, condition):
+    """Return whether a slash starts a regular expression literal.
+
+    `condition` tells whether the last closing parenthesis ended the
+    condition of an `if`, `while`, `for` or `with`. Returns None when it
+    cannot be decided without parsing, e.g. after a closing brace. `last` is
+    None after a line that was copied unchanged.
+    """
+    if last == ')':
+        return condition
+    if last == '}' or last is None:
+        return None
+    if last in ('+', '-') and ''.join(out[-2:]) == last * 2:
+        # Either `a++ / b` or `a + +/b/`
+        return None
+    if last == '' or last in REGEX_PRECEDERS:
+        return True
+    if not (last.isalpha() or last == '_'):
+        return False
+    return _last_word(out) in REGEX_KEYWORDS
+
+
+# Characters around which whitespace is removed from CSS
+CSS_PUNCTUATION = frozenset('{};,')
+
+
+def minify_js(source):
+    """Minify Javascript source code."""
+    return _minify(source, javascript=True)
+
+
+def minify_css(source):
+    """Minify a CSS stylesheet."""
+    return _minify(source, javascript=False, punctuation=CSS_PUNCTUATION)
+
+
+def _minify(source, javascript, punctuation=frozenset()):
+    """Remove comments and whitespace outside of strings.
+
+    Javascript also has line comments and regular expression literals, and
+    its line breaks are kept. In CSS all whitespace is collapsed.
+    Whitespace next to `punctuation` is removed completely.
+
+    When it is unclear whether a slash in Javascript starts a regular
+    expression, the rest of the line is copied unchanged. When that line
+    might continue on the next line, the source is returned unchanged.
+    """
+    out = []
+    last = ''
+    # For every open parenthesis whether it starts a condition. None once
+    # the parentheses cannot be tracked anymore.
+    parens = []
+    condition = False
+    i = 0
+    length = len(source)
+    whitespace = False
+    newline = False
+    while i < length:
+        c = source[i]
+        next_c = source[i + 1:i + 2]
+
+        # Comments and whitespace are collapsed into one separator
+        if c.isspace():
+            newline = newline or c == '\n' or c == '\r'
+            whitespace = True
+            i += 1
+            continue
+        if c == '/' and next_c == '/' and javascript:
+            end = source.find('\n', i)
+            i = length if end == -1 else end
+            whitespace = True
+            continue
+        if c == '/' and next_c == '*':
+            end = source.find('*/', i + 2)
+            end = length if end == -1 else end + 2
+            if source[i + 2:i + 3] == '!':
+                out.append(source[i:end])
+            newline = newline or '\n' in source[i:end]
+            whitespace = True
+            i = end
+            continue
+
+        if whitespace and out:
+            if newline and javascript:
+                out.append('\n')
+            elif last not in punctuation and c not in punctuation:
+                out.append(' ')
+        whitespace = newline = False
+
+        if c in '"\'`':
+            end = i + 1
+            while end < length and source[end] != c:
+                if source[end] == '\\':
+                    end += 1
+                end += 1
+            out.append(source[i:end + 1])
+            i = end + 1
+        elif c == '/' and javascript and _starts_regex(
+                out, last, condition) is None:
+            end = source.find('\n', i)
+            end = length if end == -1 else end
+            line = source[i:end]
+            if '/*' in line or '`' in line or line.rstrip('\r').endswith('\\'):
+                return source
+            if '(' in line or ')' in line:
+                parens = None
+            out.append(line)
+            i = end
+            c = None
+        elif c == '/' and javascript and _starts_regex(out, last, condition):
+            end = i + 1
+            in_class = False
+            while end < length:
+                char = source[end]
+                if char == '\\':
+                    end += 2
+                    continue
+                if char == '\n':
+                    break
+                if char == '[':
+                    in_class = True
+                elif char == ']':
+                    in_class = False
+                elif char == '/' and not in_class:
+                    break
+                end += 1
+            out.append(source[i:end + 1])
+            i = end + 1
+        else:
+            if javascript and c == '(' and parens is not None:
+                parens.append(_last_word(out) in CONDITION_KEYWORDS)
+            elif javascript and c == ')':
+                condition = parens.pop() if parens else None
+            out.append(c)
+            i += 1
+        last = c
+    return ''.join(out)
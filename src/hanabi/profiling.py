@@ -0,0 +1,161 @@
+#-*- x-counterpart: ../../tests/test_profiling.py; -*-
+"""A sampling profiler for finding out why routes are slow in production.
+
+Wrap an application to profile a fraction of its requests:
+
+    app = SamplingProfiler(MyApp.create_app(), rate=0.01)
+
+Or profile requests that turn out to be slow:
+
+    app = SamplingProfiler(MyApp.create_app(), threshold=0.5)
+
+While a profiled request is handled a background thread takes a sample of its
+stack every `interval` seconds. The samples are aggregated per route, which is
+the `(module, controller)` the request is dispatched to. `dump` writes them in
+the collapsed stack format that flamegraph tools read, one file per route.
+
+With a threshold every request is sampled, but the samples are only kept when
+the request took at least `threshold` seconds. Only the call into the
+application is profiled, not the sending of a streamed response.
+"""
+import collections
+import os
+import random
+import sys
+import thread
+import threading
+import time
+
+
+def route_key(controller):
+    """Return the `(module, controller)` name of a controller."""
+    return (controller.__module__.rsplit('.', 1)[-1],
+            controller.__class__.__name__.lower())
+
+
+def collapse_stack(frame, stop_code=None):
+    """Return a stack in collapsed format, the outermost frame first.
+
+    Frames above the frame running `stop_code` are left out.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        if code is stop_code:
+            break
+        names.append('%s (%s:%d)' % (code.co_name,
+                                     os.path.basename(code.co_filename),
+                                     code.co_firstlineno))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+class SamplingProfiler(object):
+    """WSGI middleware that samples the stacks of requests.
+
+    `rate` is the fraction of requests that is profiled. When `threshold` is
+    set all requests are profiled and only those which take at least
+    `threshold` seconds are kept.
+    """
+
+    def __init__(self, app, rate=0.01, threshold=None, interval=0.005):
+        self.app = app
+        self.rate = rate
+        self.threshold = threshold
+        self.interval = interval
+        # route key => Counter of collapsed stacks
+        self.stacks = {}
+        self.requests = collections.Counter()
+        # thread id => Counter of collapsed stacks for the running request
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._sampler = None
+
+    def should_profile(self):
+        return self.threshold is not None or random.random() < self.rate
+
+    def route_key(self, environ):
+        """Return the route a request is dispatched to or None."""
+        try:
+            controller, args = self.app.routes.resolve(
+                environ.get('PATH_INFO', ''))
+        except KeyError:
+            return None
+        return route_key(controller)
+
+    def __call__(self, environ, start_response):
+        if not self.should_profile():
+            return self.app(environ, start_response)
+        key = self.route_key(environ)
+        if key is None:
+            return self.app(environ, start_response)
+
+        thread_id = thread.get_ident()
+        samples = collections.Counter()
+        with self._lock:
+            self._active[thread_id] = samples
+            self._start_sampler()
+            self._wakeup.notify()
+        start = time.time()
+        try:
+            return self.app(environ, start_response)
+        finally:
+            duration = time.time() - start
+            with self._lock:
+                del self._active[thread_id]
+                if self.threshold is None or duration >= self.threshold:
+                    self.requests[key] += 1
+                    self.stacks.setdefault(
+                        key, collections.Counter()).update(samples)
+
+    def _start_sampler(self):
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._run,
+                                             name='hanabi-profiler')
+            self._sampler.daemon = True
+            self._sampler.start()
+
+    def _run(self):
+        stop_code = self.__call__.im_func.func_code
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._wakeup.wait()
+                frames = sys._current_frames()
+                for thread_id, samples in self._active.iteritems():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[collapse_stack(frame, stop_code)] += 1
+                del frames
+            time.sleep(self.interval)
+
+    def collapsed(self, key):
+        """Return the samples of a route as collapsed stack lines."""
+        with self._lock:
+            samples = self.stacks.get(key, {}).items()
+        return ['%s %d' % (stack, count)
+                for stack, count in sorted(samples) if stack]
+
+    def dump(self, directory):
+        """Write a `module.controller.folded` file for every route.
+
+        Returns the paths of the written files.
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        paths = []
+        with self._lock:
+            keys = list(self.stacks)
+        for key in keys:
+            path = os.path.join(directory, '%s.%s.folded' % key)
+            with open(path, 'w') as fileobj:
+                fileobj.writelines(line + '\n' for line in self.collapsed(key))
+            paths.append(path)
+        return paths
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.requests.clear()
@@ -4,12 +4,14 @@ from werkzeug import Request as BaseRequest
 from werkzeug.datastructures import MIMEAccept as BaseMIMEAccept
 from werkzeug import cached_property
 
+from .datastructures import LRUCache
+
 JAVASCRIPT_MIMETYPES = ('text/javascript', 'application/x-ecmascript',
                         'application/javascript', 'application/ecmascript')
 
 class MIMEAccept(BaseMIMEAccept):
 
-    @property
+    @cached_property
     def accept_javascript(self):
         """True if this object accepts Javascript."""
         for mime in JAVASCRIPT_MIMETYPES:
@@ -18,10 +20,25 @@ class MIMEAccept(BaseMIMEAccept):
         return False
 
 
+# Parsed Accept headers by their raw value. Clients send only a handful of
+# different headers, so most requests can skip parsing. The parsed objects are
+# immutable and thus safe to share between requests.
+_accept_mimetypes_cache = LRUCache(256)
+
+def parse_accept_mimetypes(value):
+    """Parse an Accept header into a `MIMEAccept` object."""
+    accept = _accept_mimetypes_cache.get(value)
+    if accept is None:
+        accept = parse_accept_header(value, MIMEAccept)
+        _accept_mimetypes_cache[value] = accept
+    return accept
+
+
 class Request(BaseRequest):
     """Request wraps the WSGI environ.
 
     This subclasses Werkzeug's basic Request wrapper to add some functionality.
+    Like in Werkzeug, everything is parsed lazily when it is first accessed.
     """
 
     def is_ajax(self):
@@ -32,4 +49,4 @@ class Request(BaseRequest):
         """List of mimetypes this client supports as `~werkzeug.datastructures.MIMEAccept` object.
         """
         # This method is overridden to use the customized MIMEAccept class
-        return parse_accept_header(self.environ.get('HTTP_ACCEPT'), MIMEAccept)
+        return parse_accept_mimetypes(self.environ.get('HTTP_ACCEPT'))
@@ -1,6 +1,7 @@
 #-*- x-counterpart: ../../tests/test_rest.py; -*-
+import collections
 import hashlib
-import json
+import zlib
 
 from werkzeug.http import quote_etag, parse_etags
 from werkzeug.exceptions import MethodNotAllowed
@@ -8,6 +9,8 @@ from werkzeug import Response
 
 from .app import Controller
 from .caching import conditional_get
+from . import encoding
+from .instrumentation import TIMINGS_KEY, clock
 
 
 class RESTController(Controller):
@@ -28,9 +31,24 @@ class RESTController(Controller):
 
     The return value of an overridden method is automatically converted to a
     JSON response.
+
+    `list` may also return an iterator, e.g. by yielding the items. The items
+    are then streamed as a JSON array in chunks of about `stream_chunk_size`
+    bytes, so the collection never has to be held in memory. A streamed
+    response only carries an ETag when `collection_version` provides one.
+
+    GET requests can be revalidated without building the resource. Override
+    `collection_version` and `resource_version` to return a cheap version
+    token, such as a row version or modification time. The ETag is then
+    derived from that token and a matching `If-None-Match` header is answered
+    with a 304 before `list` or `get` is called.
+
+    When a JSON backend that sorts natively is available, keys are sorted. The
+    body, and thus its ETag, is then the same in every worker process.
     """
     cache_policy = conditional_get
-    data_encoder = json.JSONEncoder()
+    data_encoder = encoding.get_canonical_encoder()
+    stream_chunk_size = 64 * 1024
 
     def etag(self, request, *args):
         """Create an ETag for the given arguments.
@@ -52,17 +70,29 @@ class RESTController(Controller):
             hash.update(str(data))
         return hash.hexdigest()
 
+    def content_etag(self, content):
+        """Create an ETag for an encoded response body.
+
+        The checksums are much cheaper to compute than a cryptographic hash.
+        Two of them are combined with the length of the content to keep the
+        chance of a collision low. Like `etag` it includes the app version.
+        """
+        version = str(self.app.version)
+        crc = zlib.crc32(content, zlib.crc32(version)) & 0xffffffff
+        adler = zlib.adler32(content, zlib.adler32(version)) & 0xffffffff
+        return '%08x%08x%x' % (crc, adler, len(content))
+
     def response(self, request, data, etag=None, cache_policy=None):
         """Renders `data` to a JSON response.
 
         An ETag may be specified. When it is not specified one will be generated
-        based on the data.
+        based on the encoded data. The data is encoded only once and the ETag
+        always matches the bytes that are sent. When a specified ETag matches
+        the request, the data is not encoded at all.
 
         The caching policy can be optionally configured. By default it takes the
         policy from the controller object: `cache_policy`.
         """
-        if etag is None and data is not None:
-            etag = self.etag(data)
         # FIXME: Check content-type headers
         if data is None:
             if etag is None:
@@ -70,19 +100,71 @@ class RESTController(Controller):
                                 'the response body is None')
             resp = Response(status=304, content_type='application/json')
         else:
-            # Avoid sending the resource when an ETag matches
             request_etags = parse_etags(
                 request.environ.get('HTTP_IF_NONE_MATCH'))
+            body = None
+            # A given ETag is checked before the data is encoded
+            if etag is None or not request_etags.contains(etag):
+                timings = request.environ.get(TIMINGS_KEY)
+                if timings is not None:
+                    start = clock()
+                body = self.data_encoder.encode(data)
+                if timings is not None:
+                    encoded = clock()
+                    timings.append(('json.encode', encoded - start))
+                if etag is None:
+                    etag = self.content_etag(body)
+                    if timings is not None:
+                        timings.append(('etag', clock() - encoded))
+            # Avoid sending the resource when an ETag matches
             if request_etags.contains(etag):
                  resp = Response(status=304, content_type='application/json')
             # Render the given data to a response object
             else:
-                resp = Response(self.data_encoder.encode(data), content_type='application/json')
+                resp = Response(body, content_type='application/json')
         resp.headers['ETag'] = quote_etag(etag)
         if cache_policy is None:
             cache_policy = self.cache_policy
         return cache_policy(resp)
 
+    def stream_response(self, request, items, etag=None, cache_policy=None):
+        """Streams the items from an iterator as a JSON array."""
+        resp = Response(self._encode_stream(items),
+                        content_type='application/json',
+                        direct_passthrough=True)
+        if etag is not None:
+            resp.headers['ETag'] = quote_etag(etag)
+        if cache_policy is None:
+            cache_policy = self.cache_policy
+        return cache_policy(resp)
+
+    def _encode_stream(self, items):
+        encode = self.data_encoder.encode
+        chunk_size = self.stream_chunk_size
+        chunk = ['[']
+        size = 0
+        separator = ''
+        for item in items:
+            encoded = encode(item)
+            chunk.append(separator)
+            chunk.append(encoded)
+            separator = ', '
+            size += len(encoded)
+            if size >= chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+                size = 0
+        chunk.append(']')
+        yield ''.join(chunk)
+
+    def collection_version(self, request):
+        """Return a version token for the collection or None."""
+        return None
+
+    def resource_version(self, request, id):
+        """Return a version token for the resource with `id` or None."""
+        return None
+
     def list(self, request):
         raise MethodNotAllowed
 
@@ -105,6 +187,7 @@ class RESTController(Controller):
 
     def dispatch(self, request, path=None):
         req_method = request.method
+        etag = None
 
         if req_method == 'PUT' and path:
             data = self.update(request, path)
@@ -113,6 +196,16 @@ class RESTController(Controller):
                 raise MethodNotAllowed
             data = self.create(request)
         elif req_method == 'GET':
+            if path:
+                version = self.resource_version(request, path)
+            else:
+                version = self.collection_version(request)
+            if version is not None:
+                etag = self.etag(request, version)
+                request_etags = parse_etags(
+                    request.environ.get('HTTP_IF_NONE_MATCH'))
+                if request_etags.contains(etag):
+                    return self.response(request, None, etag)
             if path:
                 data = self.get(request, path)
             else:
@@ -125,7 +218,9 @@ class RESTController(Controller):
 
         # Do automatic conversion for JSON data types
         if isinstance(data, dict) or isinstance(data, list) or data is None:
-            return self.response(request, data)
+            return self.response(request, data, etag)
+        if isinstance(data, collections.Iterator):
+            return self.stream_response(request, data, etag)
 
 #         if data is None:
 #             if method is GET:
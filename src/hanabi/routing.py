@@ -0,0 +1,110 @@
+#-*- x-counterpart: ../../tests/test_routing.py; -*-
+import threading
+
+from .datastructures import LRUCache
+
+
+class RouteTable(object):
+    """Resolves request paths to controllers.
+
+    Paths map onto the registered controllers like this:
+
+        /                  => index.Index.index()
+        /wiki              => wiki.Index.index()
+        /wiki/12           => wiki.Index.index('12')
+        /wiki/list         => wiki.List.index()
+        /wiki/page/45/edit => wiki.Page.index('45/edit')
+
+    Resolved routes are kept in a bounded LRU cache keyed by the raw path, so
+    hot URLs skip parsing entirely. The cache must be cleared whenever the
+    controllers change.
+    """
+
+    def __init__(self, controllers, cache_size=1024):
+        self.controllers = controllers
+        self.cache = LRUCache(cache_size)
+
+    def clear(self):
+        """Drop all cached resolutions."""
+        self.cache.clear()
+
+    def resolve(self, path_info):
+        """Return a `(controller, args)` tuple for the given path.
+
+        A KeyError is raised when no controller matches the path.
+        """
+        route = self.cache.get(path_info)
+        if route is None:
+            route = self.cache[path_info] = self._resolve(path_info)
+        return route
+
+    def _resolve(self, path_info):
+        parts = path_info.lstrip('/').split('/', 2)
+        nr_of_parts = len(parts)
+        # Default to the index module for root level access
+        modulename = parts[0] or 'index'
+        classname = parts[1] if nr_of_parts > 1 else 'index'
+        remaining_path = parts[2] if nr_of_parts > 2 else ''
+
+        controllers = self.controllers
+        controller = controllers.get((modulename, classname))
+        if controller is None:
+            if classname == 'index':
+                raise KeyError((modulename, classname))
+            # Unknown class names are arguments for the module's index
+            controller = controllers[(modulename, 'index')]
+            if remaining_path:
+                remaining_path = classname + '/' + remaining_path
+            else:
+                remaining_path = classname
+
+        if remaining_path:
+            return controller, (remaining_path,)
+        return controller, ()
+
+
+class LazyControllers(dict):
+    """A controller registry that imports controller modules on first use.
+
+    `pending` holds the names of the modules that have not been loaded yet.
+    Looking up a controller from a pending module calls `loader` with the
+    module name. The loader is expected to register the controllers of that
+    module. Modules are loaded under a lock, so concurrent requests load a
+    module only once.
+    """
+
+    def __init__(self, loader):
+        dict.__init__(self)
+        self.loader = loader
+        self.pending = set()
+        self.lock = threading.RLock()
+
+    def load(self, modulename):
+        """Load a pending module. Returns False if it was not pending."""
+        if modulename not in self.pending:
+            return False
+        with self.lock:
+            if modulename in self.pending:
+                self.loader(modulename)
+                self.pending.discard(modulename)
+        return True
+
+    def __missing__(self, key):
+        # The module may have been loaded by another thread meanwhile, so
+        # check again whatever `load` returns.
+        self.load(key[0])
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+        self.load(key[0])
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
@@ -0,0 +1,342 @@
+#-*- x-counterpart: ../../tests/test_server.py; -*-
+"""A pre-fork HTTP server for running applications in production.
+
+The master process creates the application and binds the listening socket.
+Then it forks the workers, which share both. Everything the application
+loaded at startup, like controllers, compiled templates and asset manifests,
+is shared copy-on-write between the workers.
+
+Every worker accepts connections in its main thread and hands them to a pool
+of `threads` threads through a queue of `queue_size` connections. When the
+queue is full, the worker answers with 503 Service Unavailable right away
+instead of letting requests pile up. The application must be thread safe when
+more than one thread is used; see `hanabi.app.Controller`.
+
+Connections that send or receive nothing for `request_timeout` seconds are
+closed, so idle or slow clients cannot keep a thread busy.
+
+A worker exits after handling `max_requests` requests, after which the master
+replaces it. This limits the effect of memory leaks. Signals sent to the
+master:
+
+    SIGHUP          Create the application again and gracefully replace all
+                    workers. Modules that are already imported are not
+                    reloaded, so changed code needs a restart.
+    SIGTERM/SIGINT  Gracefully stop: the workers finish the requests they
+                    are handling and the master exits.
+
+Only the standard library is used. Start it with `Application.run_production`.
+"""
+import errno
+import logging
+import multiprocessing
+import os
+import Queue
+import select
+import signal
+import socket
+import threading
+import time
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+log = logging.getLogger('hanabi.server')
+
+SERVICE_UNAVAILABLE = ('HTTP/1.0 503 Service Unavailable\r\n'
+                       'Content-Type: text/plain\r\n'
+                       'Content-Length: 19\r\n'
+                       'Retry-After: 1\r\n'
+                       'Connection: close\r\n'
+                       '\r\n'
+                       'Service Unavailable')
+
+
+class RequestHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        log.info('%s - %s', self.client_address[0], format % args)
+
+
+class WorkerServer(WSGIServer):
+    """A WSGI server that accepts connections on an inherited socket.
+
+    The listening socket is non-blocking. All workers wait for connections
+    on it, but only one of them gets each connection; the others must not
+    block in accept.
+
+    With more than one thread, accepted connections are queued for the
+    threads that run `handle_queued`. Reading from or writing to a connection
+    fails after `request_timeout` seconds without progress.
+    """
+    timeout = 0.5
+
+    def __init__(self, listener, app, threads=1, queue_size=None,
+                 request_timeout=30):
+        WSGIServer.__init__(self, listener.getsockname(), RequestHandler,
+                            bind_and_activate=False)
+        self.socket.close()
+        self.socket = listener
+        self.server_name = socket.getfqdn(self.server_address[0])
+        self.server_port = self.server_address[1]
+        self.setup_environ()
+        self.set_app(app)
+        self.request_timeout = request_timeout
+        self.handled = 0
+        self.rejected = 0
+        self.queue = None
+        if threads > 1:
+            self.queue = Queue.Queue(queue_size or threads)
+
+    def handle_request(self):
+        """Handle one request or return after `timeout` seconds."""
+        try:
+            readable = select.select([self.socket], [], [], self.timeout)[0]
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return
+        if readable:
+            self._handle_request_noblock()
+
+    def get_request(self):
+        connection, address = self.socket.accept()
+        connection.setblocking(1)
+        connection.settimeout(self.request_timeout)
+        return connection, address
+
+    def process_request(self, request, client_address):
+        if self.queue is None:
+            self.handled += 1
+            WSGIServer.process_request(self, request, client_address)
+            return
+        try:
+            self.queue.put_nowait((request, client_address))
+        except Queue.Full:
+            self.rejected += 1
+            self.reject(request)
+        else:
+            self.handled += 1
+
+    def handle_queued(self):
+        """Handle queued connections until None is queued."""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def reject(self, request):
+        """Answer 503 Service Unavailable without calling the application."""
+        # Read the request first. Closing a connection with unread data
+        # resets it, and the client might not see the response.
+        request.settimeout(0.1)
+        try:
+            data = ''
+            while '\r\n\r\n' not in data and len(data) < 65536:
+                chunk = request.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+            request.sendall(SERVICE_UNAVAILABLE)
+        except socket.error:
+            pass
+        self.shutdown_request(request)
+
+
+def default_workers():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+class PreforkServer(object):
+    """Runs the application created by `app_factory` in worker processes.
+
+    `app_factory` is called without arguments in the master. It is called
+    again when the master receives a SIGHUP.
+    """
+    poll_interval = 0.5
+    backlog = 128
+
+    def __init__(self, app_factory, host='127.0.0.1', port=8000, workers=None,
+                 threads=1, max_requests=0, queue_size=None,
+                 graceful_timeout=30, request_timeout=30):
+        self.app_factory = app_factory
+        self.host = host
+        self.port = port
+        self.nr_of_workers = workers or default_workers()
+        self.nr_of_threads = threads
+        self.max_requests = max_requests
+        self.queue_size = queue_size
+        self.graceful_timeout = graceful_timeout
+        self.request_timeout = request_timeout
+        self.socket = None
+        self.app = None
+        self.workers = {}
+        # Replaced workers that are finishing their requests
+        self.retired = set()
+        self._reload = False
+        self._stop = False
+
+    @property
+    def address(self):
+        return self.socket.getsockname()
+
+    def bind(self):
+        """Create the listening socket. Called by `run` when needed."""
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(self.backlog)
+        listener.setblocking(0)
+        self.socket = listener
+
+    def run(self):
+        """Run the master until it is stopped."""
+        if self.socket is None:
+            self.bind()
+        self.app = self.app_factory()
+        log.info('Listening on http://%s:%d/ with %d workers', self.address[0],
+                 self.address[1], self.nr_of_workers)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        try:
+            while not self._stop:
+                if self._reload:
+                    self._reload = False
+                    self.reload()
+                self.reap_workers()
+                while len(self.workers) < self.nr_of_workers:
+                    self.spawn_worker()
+                time.sleep(self.poll_interval)
+        finally:
+            self.stop_workers(self.workers.keys() + list(self.retired))
+            self.socket.close()
+
+    def _handle_reload(self, signum, frame):
+        self._reload = True
+
+    def _handle_stop(self, signum, frame):
+        self._stop = True
+
+    def reload(self):
+        """Create the application again and replace the workers.
+
+        Only the application is created again; modules that were imported
+        before are not reloaded. Restart the master to run changed code.
+        """
+        log.info('Reloading')
+        try:
+            self.app = self.app_factory()
+        except Exception:
+            log.exception('Reloading the application failed')
+            return
+        old_workers = self.workers.keys()
+        self.workers = {}
+        for i in range(self.nr_of_workers):
+            self.spawn_worker()
+        for pid in old_workers:
+            self.signal_worker(pid, signal.SIGTERM)
+        self.retired.update(old_workers)
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.time()
+            return pid
+        status = 0
+        try:
+            Worker(self.socket, self.app, self.nr_of_threads,
+                   self.max_requests, self.queue_size,
+                   self.request_timeout).run()
+        except BaseException:
+            log.exception('Worker failed')
+            status = 1
+        finally:
+            os._exit(status)
+
+    def reap_workers(self):
+        """Collect exited workers. Returns False when none are left."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.ECHILD:
+                    return False
+                raise
+            if not pid:
+                return True
+            self.workers.pop(pid, None)
+            self.retired.discard(pid)
+
+    def signal_worker(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    def stop_workers(self, pids):
+        """Gracefully stop the workers, killing them after a timeout."""
+        for pid in pids:
+            self.signal_worker(pid, signal.SIGTERM)
+        deadline = time.time() + self.graceful_timeout
+        while self.reap_workers():
+            if time.time() > deadline:
+                for pid in pids:
+                    self.signal_worker(pid, signal.SIGKILL)
+            time.sleep(0.05)
+        self.workers = {}
+        self.retired.clear()
+
+
+class Worker(object):
+    """Handles requests with a number of threads until it is stopped."""
+
+    def __init__(self, listener, app, threads=1, max_requests=0,
+                 queue_size=None, request_timeout=30):
+        self.server = WorkerServer(listener, app, threads, queue_size,
+                                   request_timeout)
+        self.nr_of_threads = threads
+        self.max_requests = max_requests
+        self.stopping = threading.Event()
+
+    def run(self):
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        self.serve()
+
+    def _handle_stop(self, signum, frame):
+        self.stopping.set()
+
+    def serve(self):
+        """Accept connections until `stopping` is set.
+
+        The queued requests are handled before this returns.
+        """
+        threads = []
+        if self.server.queue is not None:
+            threads = [threading.Thread(target=self.server.handle_queued)
+                       for i in range(self.nr_of_threads)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            while not self.stopping.is_set():
+                self.server.handle_request()
+                if (self.max_requests and
+                        self.server.handled >= self.max_requests):
+                    self.stopping.set()
+        finally:
+            for thread in threads:
+                self.server.queue.put(None)
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,362 @@
+#-*- x-counterpart: ../../tests/test_static.py; -*-
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+import time
+from datetime import datetime
+
+from werkzeug import Response
+from werkzeug.exceptions import NotFound
+from werkzeug.http import (parse_accept_header, parse_range_header,
+                           is_resource_modified, quote_etag)
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+from . import manifest
+
+FINGERPRINTS_NAME = 'fingerprints.json'
+
+# The names of the bundles in the `_cache` directory, e.g. `<md5>.js.gz`
+HASHED_NAME_RE = re.compile(r'^[0-9a-f]{32}(\.[a-z0-9]+)+$')
+
+
+class StaticFile(object):
+    """The information about a file that is needed to serve it."""
+    __slots__ = ('path', 'size', 'mtime', 'last_modified', 'etag', 'mimetype')
+
+    def __init__(self, path, size, mtime, mimetype):
+        self.path = path
+        self.size = size
+        self.mtime = int(mtime)
+        self.last_modified = datetime.utcfromtimestamp(int(mtime))
+        self.etag = '%x-%x' % (int(mtime), size)
+        self.mimetype = mimetype
+
+
+def read_range(fileobj, length, buffer_size=64 * 1024):
+    """Yield `length` bytes from the current position of `fileobj`."""
+    try:
+        while length > 0:
+            data = fileobj.read(min(length, buffer_size))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        fileobj.close()
+
+
+class Fingerprints(object):
+    """Content hashes of the files in a static directory.
+
+    A fingerprint is added to the URL of a file, e.g.
+    `/static/images/logo.png?v=0cc175b9c0f1`. The URL changes whenever the
+    content changes, so the file can be cached by browsers forever.
+
+    Fingerprints are computed when they are first needed. Every
+    `recheck_interval` seconds the modification time and size of the file
+    are checked again, and the file is hashed again when they changed. So a
+    changed file gets a new URL without a restart. `build` computes them for
+    the whole directory and stores them in an index in the `_cache`
+    directory. The index is validated in the same way, so processes that load
+    it only hash files that changed.
+    """
+    length = 12
+    recheck_interval = 5
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self.index_path = os.path.join(self.directory, '_cache',
+                                       FINGERPRINTS_NAME)
+        # relpath => (time of the next check, signature, fingerprint)
+        self._fingerprints = {}
+        self._stored = manifest.read_manifest(self.index_path) or {}
+
+    def compute(self, relpath):
+        """Return the signature and fingerprint of a file."""
+        path = safe_join(self.directory, relpath)
+        if path is None:
+            raise ValueError('Invalid static path: %s' % relpath)
+        try:
+            signature = manifest.file_signature(path)
+        except OSError:
+            raise ValueError('No static file named: %s found at: %s' %
+                             (relpath, path))
+        stored = self._stored.get(relpath)
+        if stored is not None and stored[0] == signature:
+            return stored
+        current = self._fingerprints.get(relpath)
+        if current is not None and current[1] == signature:
+            return [signature, current[2]]
+        hash = hashlib.md5()
+        with open(path, 'rb') as static_file:
+            for data in iter(lambda: static_file.read(64 * 1024), ''):
+                hash.update(data)
+        return [signature, hash.hexdigest()[:self.length]]
+
+    def fingerprint(self, relpath):
+        """Return the fingerprint of the file at a path relative to the
+        directory."""
+        entry = self._fingerprints.get(relpath)
+        if entry is not None and entry[0] > time.time():
+            return entry[2]
+        return self.refresh(relpath)
+
+    def refresh(self, relpath):
+        """Check the file now and return its current fingerprint."""
+        signature, fingerprint = self.compute(relpath)
+        self._fingerprints[relpath] = (
+            time.time() + self.recheck_interval, signature, fingerprint)
+        return fingerprint
+
+    def url(self, relpath):
+        """Return the fingerprinted URL of a static file."""
+        return '/static/%s?v=%s' % (relpath, self.fingerprint(relpath))
+
+    def build(self):
+        """Fingerprint all files and write the index. Returns the index."""
+        index = {}
+        for root, dirs, files in os.walk(self.directory):
+            relroot = os.path.relpath(root, self.directory)
+            if relroot == '_cache':
+                dirs[:] = []
+                continue
+            for filename in files:
+                relpath = os.path.normpath(os.path.join(relroot, filename))
+                relpath = relpath.replace(os.sep, '/')
+                index[relpath] = self.compute(relpath)
+        cache_dir = os.path.dirname(self.index_path)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        manifest.write_manifest(self.index_path, index)
+        self._stored = index
+        next_check = time.time() + self.recheck_interval
+        self._fingerprints = dict(
+            (relpath, (next_check, entry[0], entry[1]))
+            for relpath, entry in index.iteritems())
+        return index
+
+
+class StaticFiles(object):
+    """A WSGI application that serves the files in a directory.
+
+    The size, modification time and ETag of every file are indexed when the
+    application is created. Files that are added later are indexed when they
+    are first requested. A file that was replaced is indexed again when it is
+    sent. Files are sent through the server's `wsgi.file_wrapper` when it is
+    available. Conditional requests and single byte ranges are supported;
+    requests for several ranges get the whole file.
+
+    When a precompressed copy of a file exists (the file name with `.gz`
+    appended) and the client accepts gzip, the compressed copy is sent. Thus
+    nothing has to be compressed while handling a request. Whether a file has
+    a compressed copy is looked up once.
+
+    Files in the `_cache` directory have content hashes in their names. They
+    are sent with far-future and immutable cache headers. So are files that
+    are requested with their current fingerprint (see `Fingerprints`) in the
+    query string. When a replaced file is noticed, its fingerprint is checked
+    again before the headers are sent. Other files may be cached for
+    `max_age` seconds. The other files in the `_cache` directory, like the
+    indexes of bundles and fingerprints, are internal and never sent.
+    """
+    max_age = 3600
+    immutable_max_age = 365 * 24 * 3600
+    immutable_dir = '_cache/'
+
+    def __init__(self, directory, fingerprints=None):
+        self.directory = os.path.abspath(directory)
+        self.fingerprints = fingerprints
+        self.index = {}
+        # relpath => whether the file has a precompressed copy
+        self.compressed = {}
+        self.build_index()
+
+    def build_index(self):
+        """Index all files in the directory."""
+        index = {}
+        for root, dirs, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                relpath = os.path.relpath(path, self.directory)
+                relpath = relpath.replace(os.sep, '/')
+                if self.is_private(relpath):
+                    continue
+                static_file = self.stat(path)
+                if static_file is not None:
+                    index[relpath] = static_file
+        self.index = index
+        self.compressed = {}
+
+    def stat(self, path, stat_result=None):
+        if stat_result is None:
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                return None
+        if not stat.S_ISREG(stat_result.st_mode):
+            return None
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        return StaticFile(path, stat_result.st_size, stat_result.st_mtime,
+                          mimetype)
+
+    def normalize(self, path):
+        """Return the normalized path relative to the directory or None.
+
+        Paths that point outside of the directory are rejected. Paths are
+        normalized before anything else, so `./` and `x/../` cannot be used
+        to get around `is_private` or to fill the index.
+        """
+        relpath = posixpath.normpath(path.lstrip('/'))
+        if (relpath in ('.', '..') or relpath.startswith(('../', '/')) or
+                '\\' in relpath):
+            return None
+        return relpath
+
+    def lookup(self, relpath):
+        """Return the `StaticFile` for a normalized relative path or None."""
+        static_file = self.index.get(relpath)
+        if static_file is None:
+            if self.is_private(relpath):
+                return None
+            path = safe_join(self.directory, relpath)
+            if path is None:
+                return None
+            static_file = self.stat(path)
+            if static_file is not None:
+                self.index[relpath] = static_file
+        return static_file
+
+    def is_private(self, relpath):
+        """Check if a path is an internal file of the `_cache` directory."""
+        return (relpath.startswith(self.immutable_dir) and
+                HASHED_NAME_RE.match(relpath[len(self.immutable_dir):]) is None)
+
+    def lookup_compressed(self, relpath):
+        """Return the `StaticFile` of the precompressed copy or None."""
+        has_copy = self.compressed.get(relpath)
+        if has_copy is None:
+            compressed = self.lookup(relpath + '.gz')
+            self.compressed[relpath] = compressed is not None
+            return compressed
+        if has_copy:
+            return self.lookup(relpath + '.gz')
+        return None
+
+    def is_immutable(self, relpath, query_string):
+        if relpath.startswith(self.immutable_dir):
+            return True
+        if self.fingerprints is None or not query_string.startswith('v='):
+            return False
+        try:
+            return query_string[2:] == self.fingerprints.fingerprint(relpath)
+        except ValueError:
+            return False
+
+    def cache_control(self, relpath, query_string=''):
+        if self.is_immutable(relpath, query_string):
+            return 'public, max-age=%d, immutable' % self.immutable_max_age
+        return 'public, max-age=%d' % self.max_age
+
+    def accepts_gzip(self, environ):
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+        return accept['gzip'] > 0
+
+    def is_modified(self, environ, response, served):
+        """Set the validators of `served` on the response and check them.
+
+        When the client has the current version, the response is turned
+        into a 304 Not Modified response.
+        """
+        response.set_etag(served.etag)
+        response.last_modified = served.last_modified
+        if is_resource_modified(environ, etag=served.etag,
+                                last_modified=served.last_modified):
+            return True
+        response.status_code = 304
+        return False
+
+    def __call__(self, environ, start_response):
+        relpath = self.normalize(environ.get('PATH_INFO', ''))
+        static_file = None
+        if relpath is not None:
+            static_file = self.lookup(relpath)
+        if static_file is None:
+            return NotFound()(environ, start_response)
+
+        cache_control = self.cache_control(
+            relpath, environ.get('QUERY_STRING', ''))
+        headers = [('Cache-Control', cache_control),
+                   ('Accept-Ranges', 'bytes')]
+        range_header = environ.get('HTTP_RANGE')
+        served_relpath = relpath
+        served = static_file
+        compressed = self.lookup_compressed(relpath)
+        if compressed is not None:
+            headers.append(('Vary', 'Accept-Encoding'))
+            # Ranges always refer to the uncompressed file
+            if range_header is None and self.accepts_gzip(environ):
+                served_relpath = relpath + '.gz'
+                served = compressed
+                headers.append(('Content-Encoding', 'gzip'))
+
+        response = Response(mimetype=static_file.mimetype, headers=headers,
+                            direct_passthrough=True)
+        if not self.is_modified(environ, response, served):
+            return response(environ, start_response)
+
+        try:
+            fileobj = open(served.path, 'rb')
+        except IOError:
+            self.index.pop(served_relpath, None)
+            self.compressed.pop(relpath, None)
+            return NotFound()(environ, start_response)
+
+        # The index may be outdated when the file was replaced, while the
+        # open file is not.
+        stat_result = os.fstat(fileobj.fileno())
+        if (stat_result.st_size != served.size or
+                int(stat_result.st_mtime) != served.mtime):
+            served = self.stat(served.path, stat_result)
+            self.index[served_relpath] = served
+            if self.fingerprints is not None:
+                # An old fingerprint must not make the new content immutable
+                try:
+                    self.fingerprints.refresh(relpath)
+                except ValueError:
+                    pass
+                response.headers['Cache-Control'] = self.cache_control(
+                    relpath, environ.get('QUERY_STRING', ''))
+            if not self.is_modified(environ, response, served):
+                fileobj.close()
+                return response(environ, start_response)
+
+        byte_range = None
+        if range_header is not None:
+            if_range = environ.get('HTTP_IF_RANGE')
+            if if_range is None or if_range == quote_etag(served.etag):
+                byte_range = parse_range_header(range_header)
+        if byte_range is not None and len(byte_range.ranges) != 1:
+            # Multipart responses are not supported, so send the whole file
+            byte_range = None
+        if byte_range is not None:
+            start_stop = byte_range.range_for_length(served.size)
+            if start_stop is None:
+                fileobj.close()
+                response.status_code = 416
+                response.headers['Content-Range'] = 'bytes */%d' % served.size
+                return response(environ, start_response)
+            start, stop = start_stop
+            fileobj.seek(start)
+            response.response = read_range(fileobj, stop - start)
+            response.status_code = 206
+            response.content_length = stop - start
+            response.headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                start, stop - 1, served.size)
+        else:
+            response.response = wrap_file(environ, fileobj)
+            response.content_length = served.size
+        return response(environ, start_response)
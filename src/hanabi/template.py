@@ -1,9 +1,10 @@
 #-*- x-counterpart: ../../tests/test_template.py; -*-
 import os
 
-from werkzeug import BaseResponse
+from werkzeug import BaseResponse, Response
 
 from .app import Controller
+from .instrumentation import TIMINGS_KEY, clock
 
 
 class TemplateController(Controller):
@@ -11,7 +12,35 @@ class TemplateController(Controller):
 
     The template name is automatically inferred from the module and class name.
 
+    The template names are resolved once and the compiled templates are kept
+    on the controller. Only in debug mode templates are looked up on every
+    request, so changes are picked up.
+
+    Large pages can be streamed by setting `stream_template`. The page is
+    then sent while it is being rendered instead of after rendering the whole
+    page. `stream_buffer_size` sets how many template chunks are buffered
+    before they are sent. Set it to 0 to send every chunk right away.
     """
+    stream_template = False
+    stream_buffer_size = 5
+
+    def __init__(self, app):
+        super(TemplateController, self).__init__(app)
+        modulename = self.__module__.rsplit('.', 1)[-1]
+        classname = self.__class__.__name__.lower()
+        self.html_template = os.path.join(modulename, classname + '.html')
+        self.js_template = os.path.join(modulename, classname + '.js')
+        self._templates = {}
+
+    def get_template(self, template_name):
+        """Return the compiled template with the given name."""
+        if self.app.debug_mode:
+            return self.app.templates.get_template(template_name)
+        try:
+            return self._templates[template_name]
+        except KeyError:
+            template = self.app.templates.get_template(template_name)
+            return self._templates.setdefault(template_name, template)
 
     def dispatch(self, request, *args, **kwargs):
         data = self.index(request, *args, **kwargs)
@@ -33,17 +62,31 @@ class TemplateController(Controller):
         if isinstance(data, BaseResponse):
             return data
 
-        modulename = self.__module__.rsplit('.', 1)[-1]
-        classname = self.__class__.__name__.lower()
-
-        template_extension = '.html'
-        content_type = 'text/html'
+        template_name = self.html_template
+        mimetype = 'text/html'
         if request.is_ajax():
             if request.accept_mimetypes.accept_javascript:
                 # Render JS template
-                template_extension = '.js'
-                content_type = 'application/javascript'
+                template_name = self.js_template
+                mimetype = 'application/javascript'
+
+        timings = request.environ.get(TIMINGS_KEY)
+        if timings is not None:
+            start = clock()
+        template = self.get_template(template_name)
+        if timings is not None:
+            looked_up = clock()
+            timings.append(('template.lookup', looked_up - start))
+        if self.stream_template:
+            return self.stream_response(template, data, mimetype)
+        body = template.render(**data)
+        if timings is not None:
+            timings.append(('template.render', clock() - looked_up))
+        return body
 
-        template_name = os.path.join(modulename, classname + template_extension)
-        template = self.app.templates.get_template(template_name)
-        return template.render(**data)
+    def stream_response(self, template, data, mimetype):
+        """Return a response that renders the template while it is sent."""
+        stream = template.stream(**data)
+        if self.stream_buffer_size:
+            stream.enable_buffering(self.stream_buffer_size)
+        return Response(stream, mimetype=mimetype)
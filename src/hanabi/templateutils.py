@@ -1,24 +1,71 @@
 #-*- x-counterpart: ../../tests/test_templateutils.py; -*-
-import shutil
-import tempfile
+import gzip
 import hashlib
 import os
+import posixpath
 import re
-import itertools
-from jinja2 import Markup
+import threading
+import time
+from cStringIO import StringIO
+from jinja2 import Markup, escape
+
+from . import manifest
+from .minify import minify_js, minify_css
+
+MANIFEST_NAME = 'manifest.json'
+BUNDLE_INDEX_NAME = 'bundles.json'
 
 class URLFor(object):
+    """Generates URL's for controllers, e.g. `url_for('wiki.Page', 12)`.
+
+    The URL prefix of a controller is validated once and then cached by the
+    controller path. Controllers can be replaced but never unregistered, so
+    the cached prefixes stay valid.
+    """
 
     def __init__(self, application):
         self.app = application
+        self._prefixes = {}
 
-    def __call__(self, controller_path, *args):
-        args = map(str, args)
+    def prefix(self, controller_path):
+        """Return the URL of the controller at `controller_path`."""
+        try:
+            return self._prefixes[controller_path]
+        except KeyError:
+            pass
         modulename, classname = controller_path.lower().split('.')
         if (modulename, classname) not in self.app.controllers:
             raise KeyError('Controller: %s in module: %s is not registered.' %
                                (classname, modulename))
-        return '/' + '/'.join(itertools.chain([modulename, classname], args))
+        return self._prefixes.setdefault(
+            controller_path, '/' + modulename + '/' + classname)
+
+    def __call__(self, controller_path, *args):
+        try:
+            prefix = self._prefixes[controller_path]
+        except KeyError:
+            prefix = self.prefix(controller_path)
+        if args:
+            return prefix + '/' + '/'.join(map(str, args))
+        return prefix
+
+    def many(self, controller_path, args_list):
+        """Generate URL's for many sets of arguments for one controller.
+
+        Every item of `args_list` is either a single argument or a tuple of
+        arguments.
+        """
+        prefix = self.prefix(controller_path)
+        urls = []
+        for args in args_list:
+            if isinstance(args, tuple):
+                if args:
+                    urls.append(prefix + '/' + '/'.join(map(str, args)))
+                else:
+                    urls.append(prefix)
+            else:
+                urls.append(prefix + '/' + str(args))
+        return urls
 
 
 # Store the escape patterns as a list to make sure the order is determined
@@ -34,21 +81,54 @@ JS_ESCAPE_MAPPING = dict(JS_ESCAPE_PATTERNS)
 JS_REPLACEMENT_RE = re.compile(
     '(' + '|'.join([re.escape(p) for p, r in JS_ESCAPE_PATTERNS]) + ')')
 
-def js_escape(value):
-    if value:
-        def replace_js_pattern(match):
-            return JS_ESCAPE_MAPPING[match.group(0)]
-        # Convert to unicode to get rid of Markup objects
+# The same escaping as a sequence of plain replacements, which is a lot faster
+# than a regular expression with a callback. Backslashes are escaped first so
+# the backslashes added by the other steps are left alone. Carriage returns
+# are normalized to line feeds before those are escaped.
+JS_ESCAPE_STEPS = (
+    (u'\\', u'\\\\'),
+    (u'\r\n', u'\n'),
+    (u'\r', u'\n'),
+    (u'\n', u'\\n'),
+    (u'"', u'\\"'),
+    (u"'", u"\\'"),
+    (u'</', u'<\\/'))
+JS_SPECIAL_CHARS_RE = re.compile(u'[\\\\\r\n"\'<]')
+
+def js_escape(value, memo=None):
+    """Escape a value for use in a Javascript string.
+
+    A dict can be passed as `memo` to cache the escaped values. This helps
+    when the same values are escaped over and over again, e.g. in a loop.
+    """
+    if not value:
+        return value
+    if memo is not None:
+        try:
+            return memo[value]
+        except KeyError:
+            pass
+    original = value
+    # Convert to unicode to get rid of Markup objects
+    if type(value) is not unicode:
         value = unicode(value)
-        value = JS_REPLACEMENT_RE.sub(replace_js_pattern, value)
+    # Most values need no escaping at all
+    if JS_SPECIAL_CHARS_RE.search(value) is not None:
+        for pattern, replacement in JS_ESCAPE_STEPS:
+            if pattern in value:
+                value = value.replace(pattern, replacement)
+    if memo is not None:
+        memo[original] = value
     return value
 
-# Static helpers, look in the static dir, append cache header ?121212 (mtime / app version)
-# image_tag
-# favicon_link_tag
-# javascript_include_tag 'file.js', 'name.js', cache_as='blah.js'
-# stylesheet_link_tag
-# add profiler
+def gzip_compress(data):
+    """Gzip the data. The output only depends on the input data."""
+    buf = StringIO()
+    gzip_file = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0)
+    gzip_file.write(data)
+    gzip_file.close()
+    return buf.getvalue()
+
 
 class ResourceHelper(object):
     """A base class for helpers that need to work with static resources.
@@ -56,14 +136,54 @@ class ResourceHelper(object):
     Static resources are things like Javascript or CSS files. This base class
     makes it easy to write code that automatically concatenates the resources
     under a cache friendly name.
+
+    Bundles can be built ahead of time with `hanabi.assets.build_assets`. The
+    resulting manifest is read once per process, after which looking up a
+    bundle does not touch the filesystem.
+
+    Other bundles are built on first use and recorded in a shared index in
+    the cache directory. The index is keyed by the resource names and the
+    modification times and sizes of their files and `dependencies`. Other
+    processes, and later runs, find the bundle there without hashing the
+    resources. Every `recheck_interval` seconds the files of a bundle are checked again,
+    so changes are picked up without a restart.
+
+    Cached bundles are looked up without locking. Building and checking
+    bundles is done under a lock, so every bundle is built only once.
     """
 
     resource_type = ''
     extension = ''
+    minifier = None
+    recheck_interval = 5
 
     def __init__(self, app):
         self.app = app
         self._cached_resource_urls = {}
+        self._debug_resource_urls = {}
+        # resources => (time of the next check, signature)
+        self._bundle_checks = {}
+        self._manifest_loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def static_dir(self):
+        return os.path.join(self.app.package_dir, 'static')
+
+    @property
+    def cache_dir(self):
+        return os.path.join(self.static_dir, '_cache')
+
+    def load_manifest(self):
+        """Add the bundles from the asset manifest to the cached URL's."""
+        data = manifest.read_manifest(
+            os.path.join(self.cache_dir, MANIFEST_NAME))
+        if data is not None:
+            bundles = data['bundles'].get(self.resource_type, {})
+            for key, urls in bundles.iteritems():
+                self._cached_resource_urls.setdefault(
+                    tuple(key.split(',')), urls)
+        self._manifest_loaded = True
 
     def resource_urls(self, *resources):
         """Returns the URL's for the given resources.
@@ -75,50 +195,151 @@ class ResourceHelper(object):
         and resource contents. This makes it possible to cache the concatenated
         resources indefinitely.
         """
-        try:
-            return self._cached_resource_urls[resources]
-        except KeyError:
-            pass
-
         if self.app.debug_mode:
-            urls = []
-            for resource in resources:
-                url = '/static/'
-                if self.resource_type:
-                    url += self.resource_type + '/'
-                urls.append(url + resource)
+            try:
+                return self._debug_resource_urls[resources]
+            except KeyError:
+                pass
+            prefix = '/static/'
+            if self.resource_type:
+                prefix += self.resource_type + '/'
+            return self._debug_resource_urls.setdefault(
+                resources, [prefix + resource for resource in resources])
+
+        urls = self._cached_resource_urls.get(resources)
+        if urls is not None:
+            check = self._bundle_checks.get(resources)
+            if check is None or check[0] > time.time():
+                return urls
+        with self._lock:
+            return self._bundle_urls(resources)
+
+    def _bundle_urls(self, resources):
+        # Another thread may have done the work while this one waited for
+        # the lock, so the cache is checked again.
+        urls = self._cached_resource_urls.get(resources)
+        if urls is not None:
+            check = self._bundle_checks.get(resources)
+            if check is None or check[0] > time.time():
+                return urls
+            return self.recheck_bundle(resources, urls, check[1])
+
+        if not self._manifest_loaded:
+            self.load_manifest()
+            if resources in self._cached_resource_urls:
+                return self._cached_resource_urls[resources]
+
+        signature = self.signature(resources)
+        return self.cache_bundle(resources, signature)
+
+    def resource_path(self, resource):
+        return os.path.join(self.static_dir, self.resource_type, resource)
+
+    def dependencies(self, resource):
+        """Return the static files whose content ends up in the bundle too.
+
+        The paths are relative to the static directory. Changes to these
+        files invalidate the bundles of the resource.
+        """
+        return []
+
+    def signature(self, resources):
+        """Return the modification times and sizes of the resources and
+        their dependencies."""
+        signature = []
+        for resource in resources:
+            path = self.resource_path(resource)
+            try:
+                signature.append(manifest.file_signature(path))
+                dependencies = self.dependencies(resource)
+            except (OSError, IOError):
+                raise ValueError('No resource named: %s found at: %s' %
+                                 (resource, path))
+            for relpath in dependencies:
+                try:
+                    signature.append([relpath, manifest.file_signature(
+                        os.path.join(self.static_dir, relpath))])
+                except OSError:
+                    signature.append([relpath, None])
+        return signature
+
+    def recheck_bundle(self, resources, urls, signature):
+        """Rebuild a bundle when its resources changed."""
+        try:
+            current = self.signature(resources)
+        except ValueError:
+            # Keep serving the bundle while resources are being replaced
+            current = signature
+        if current == signature:
+            self._bundle_checks[resources] = (
+                time.time() + self.recheck_interval, signature)
             return urls
+        return self.cache_bundle(resources, current)
 
+    def bundle_key(self, resources, signature):
+        key = hashlib.md5(self.resource_type)
+        key.update(repr((resources, signature)))
+        return key.hexdigest()
+
+    def cache_bundle(self, resources, signature):
+        """Find or build the bundle for resources with the given signature."""
+        key = self.bundle_key(resources, signature)
+        index_path = os.path.join(self.cache_dir, BUNDLE_INDEX_NAME)
+        index = manifest.read_manifest(index_path) or {}
+        url = index.get(key)
+        if url is None or not os.path.exists(
+                os.path.join(self.static_dir, url[len('/static/'):])):
+            url = self.build_bundle(resources)
+            with manifest.locked(index_path + '.lock'):
+                index = manifest.read_manifest(index_path) or {}
+                index[key] = url
+                manifest.write_manifest(index_path, index)
+        if self.recheck_interval is not None:
+            self._bundle_checks[resources] = (
+                time.time() + self.recheck_interval, signature)
+        self._cached_resource_urls[resources] = [url]
+        return [url]
+
+    def build_bundle(self, resources, minify=False, compress=False):
+        """Concatenate the resources into the cache dir and return its URL.
+
+        With `minify` the bundle is passed through the `minifier` of the
+        helper. With `compress` a gzipped copy is stored next to the bundle,
+        which the static file server sends to clients that accept it.
+        """
         # Create a hash for all the resources. This will be used as the name of
         # the concatenated file.
         hash = hashlib.md5(self.resource_type)
 
-        static_dir = os.path.join(self.app.package_dir, 'static')
-
-        concat_fp, concat_temp = tempfile.mkstemp()
-        concat_file = os.fdopen(concat_fp, 'w')
-
+        parts = []
         for resource in resources:
-            path = os.path.join(static_dir, self.resource_type, resource)
+            path = self.resource_path(resource)
             if not os.path.exists(path):
                 raise ValueError('No resource named: %s found at: %s' %
                                  (resource, path))
             with open(path) as resource_file:
-                data = resource_file.read()
+                data = self.transform(resource, resource_file.read())
                 hash.update(data)
-                concat_file.write(data)
-                concat_file.write('\n')
-        concat_file.close()
+                parts.append(data)
+                parts.append('\n')
+        data = ''.join(parts)
+        if minify and self.minifier is not None:
+            hash.update('\0minified')
+            data = self.minifier(data)
 
-        cache_dir = os.path.join(static_dir, '_cache')
+        cache_dir = self.cache_dir
         if not os.path.exists(cache_dir):
             os.mkdir(cache_dir)
         concat_name = hash.hexdigest() + self.extension
-        concat_path = os.path.join(cache_dir,  concat_name)
-        shutil.move(concat_temp, concat_path)
+        concat_path = os.path.join(cache_dir, concat_name)
+        manifest.write_file(concat_path, data)
+        if compress:
+            manifest.write_file(concat_path + '.gz', gzip_compress(data))
+        return '/static/_cache/' + concat_name
 
-        return self._cached_resource_urls.setdefault(
-            resources, ['/static/_cache/' + concat_name])
+    def transform(self, resource, data):
+        """Process the content of a resource before it is bundled."""
+        return data
 
     def __call__(self, *resources):
         raise NotImplementedError
@@ -135,9 +356,138 @@ class JavascriptInclude(ResourceHelper):
     """
     resource_type = 'javascript'
     extension = '.js'
+    minifier = staticmethod(minify_js)
 
     def __call__(self, *resources):
         urls = self.resource_urls(*resources)
         html = [u'<script type="text/javascript" src="%s"></script>' % url
                 for url in urls]
         return Markup(u''.join(html))
+
+
+# Matches url(...) references in stylesheets
+CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)([^'")]+?)\1\s*\)''')
+
+
+class StylesheetInclude(ResourceHelper):
+    """Generates link tags for stylesheets, e.g. `css_include('a.css')`.
+
+    Like `JavascriptInclude` the stylesheets are bundled in production mode.
+    The bundle is stored in another directory than the stylesheets, so
+    relative `url()` references are rewritten to absolute URL's. These
+    include the fingerprint of the referenced file, so the referenced files
+    are dependencies of the bundle.
+    """
+    resource_type = 'css'
+    extension = '.css'
+    minifier = staticmethod(minify_css)
+
+    def __init__(self, app):
+        ResourceHelper.__init__(self, app)
+        # resource => (signature, static files it refers to)
+        self._references = {}
+
+    def static_relpath(self, resource, url):
+        """Return the path of a referenced static file or None."""
+        if url.startswith(('data:', '#', 'http:', 'https:', '//')):
+            return None
+        path = url.partition('#')[0].split('?', 1)[0]
+        if path.startswith('/static/'):
+            return path[len('/static/'):]
+        elif path.startswith('/'):
+            return None
+        base = posixpath.dirname(posixpath.join(self.resource_type, resource))
+        return posixpath.normpath(posixpath.join(base, path))
+
+    def dependencies(self, resource):
+        """Return the static files referred to with `url()`.
+
+        The fingerprints of these files are part of the bundle. The
+        references are only read again when the stylesheet changed.
+        """
+        path = self.resource_path(resource)
+        signature = manifest.file_signature(path)
+        references = self._references.get(resource)
+        if references is not None and references[0] == signature:
+            return references[1]
+        with open(path) as resource_file:
+            data = resource_file.read()
+        relpaths = set()
+        for match in CSS_URL_RE.finditer(data):
+            relpath = self.static_relpath(resource, match.group(2).strip())
+            if relpath is not None:
+                relpaths.add(relpath)
+        relpaths = sorted(relpaths)
+        self._references[resource] = (signature, relpaths)
+        return relpaths
+
+    def rewrite_url(self, resource, url):
+        relpath = self.static_relpath(resource, url)
+        if relpath is None:
+            return url
+        separator, suffix = url.partition('#')[1:]
+        # The bundle is only built when it or its dependencies changed, so
+        # the fingerprint is computed again instead of taken from the cache.
+        try:
+            new_url = '/static/%s?v=%s' % (
+                relpath, self.app.fingerprints.refresh(relpath))
+        except ValueError:
+            new_url = '/static/' + relpath
+        return new_url + separator + suffix
+
+    def transform(self, resource, data):
+        return CSS_URL_RE.sub(lambda match: 'url("%s")' % self.rewrite_url(
+            resource, match.group(2).strip()), data)
+
+    def __call__(self, *resources):
+        urls = self.resource_urls(*resources)
+        html = [u'<link rel="stylesheet" type="text/css" href="%s">' % url
+                for url in urls]
+        return Markup(u''.join(html))
+
+
+class StaticHelper(object):
+    """A base class for helpers that link to a single static file.
+
+    In production mode the URL's include the fingerprint of the file, so
+    they can be cached by browsers forever.
+    """
+    directory = ''
+
+    def __init__(self, app):
+        self.app = app
+
+    def url(self, name):
+        relpath = posixpath.join(self.directory, name)
+        if self.app.debug_mode:
+            return '/static/' + relpath
+        return self.app.fingerprints.url(relpath)
+
+    def tag(self, name, attributes):
+        html = [u'<', name]
+        for key, value in sorted(attributes.iteritems()):
+            if value is not None:
+                html.append(u' %s="%s"' % (key.rstrip('_'), escape(value)))
+        html.append(u'>')
+        return Markup(u''.join(html))
+
+
+class ImageTag(StaticHelper):
+    """Generates image tags, e.g. `image_tag('logo.png', alt='Logo')`.
+
+    Images are looked up in the `images` directory. Keyword arguments are
+    added as attributes; use `class_` for the class attribute.
+    """
+    directory = 'images'
+
+    def __call__(self, name, **attributes):
+        attributes['src'] = self.url(name)
+        return self.tag('img', attributes)
+
+
+class FaviconLink(StaticHelper):
+    """Generates a link tag for the favicon, e.g. `favicon_link_tag()`."""
+
+    def __call__(self, name='favicon.ico', rel='shortcut icon', **attributes):
+        attributes.update(rel=rel, href=self.url(name))
+        return self.tag('link', attributes)
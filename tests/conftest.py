@@ -0,0 +1,34 @@
+import random
+import sys
+import threading
+import pytest
+
+
+@pytest.fixture
+def concurrently():
+    """Return a function that runs `work` in several threads at once.
+
+    `work` is called with a `random.Random` that is seeded differently for
+    every thread. The threads are switched often to make races more likely.
+    The exceptions raised by `work` are returned.
+    """
+    def run(work, threads=8, check_interval=1):
+        errors = []
+        def target(seed):
+            try:
+                work(random.Random(seed))
+            except Exception, e:
+                errors.append(e)
+        old_check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(check_interval)
+        try:
+            workers = [threading.Thread(target=target, args=(i,))
+                       for i in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            sys.setcheckinterval(old_check_interval)
+        return errors
+    return run
@@ -1,6 +1,12 @@
 #-*- x-counterpart: ../src/hanabi/app.py; -*-
+import os
+import shutil
+import sys
+import tempfile
 import pytest
 from hanabi import Application
+from hanabi import manifest
+from hanabi.static import StaticFiles
 from werkzeug.test import Client
 from werkzeug import Response
 
@@ -55,3 +61,140 @@ def test_reserved_controller_registration():
     app = DemoApp()
     with pytest.raises(ValueError):
         app.register_controller('static', 'Index', dict)
+
+
+def test_register_controller_after_dispatch():
+    from hanabi.examples.werkzeug.controllers.hello import World
+    app = DemoApp.create_app()
+    client = Client(app, Response)
+    assert client.get('/hello/world').data == 'Hello World!'
+    app.register_controller('hello', 'World', type(
+        'World', (World,), {'index': lambda self, request: 'Replaced!'}))
+    assert client.get('/hello/world').data == 'Replaced!'
+
+
+class LazyDemoApp(DemoApp):
+    lazy_controllers = True
+
+
+@pytest.mark.parametrize('app_class', [DemoApp, LazyDemoApp])
+def test_dispatch_from_many_threads(app_class, concurrently):
+    app = app_class.create_app()
+    expected = {'/': 'Index Index!', '/hello': 'Hello Index!',
+                '/hello/world': 'Hello World!'}
+    def work(rnd):
+        client = Client(app, Response)
+        for i in range(100):
+            path = rnd.choice(expected.keys())
+            response = client.get(path)
+            assert response.status_code == 200
+            assert response.data == expected[path]
+    assert concurrently(work, threads=16, check_interval=10) == []
+
+
+def test_lazy_controllers(capsys):
+    app = LazyDemoApp.create_app()
+    assert app.controllers.keys() == []
+    assert app.controllers.pending == set(['index', 'hello'])
+    response = Client(app, Response).get('/hello/world')
+    assert response.data == 'Hello World!'
+    # Loading controllers while handling a request must not write to stdout
+    assert capsys.readouterr() == ('', '')
+    assert set(app.controllers.keys()) == set([
+        ('hello', 'world'), ('hello', 'index')])
+
+
+def test_prewarm_lazy_controllers():
+    class PrewarmedApp(LazyDemoApp):
+        prewarm_controllers = ('index',)
+    app = PrewarmedApp.create_app()
+    assert app.controllers.keys() == [('index', 'index')]
+    assert app.controllers.pending == set(['hello'])
+
+
+class TestControllerManifest(object):
+
+    def setup_method(self, method):
+        self.dir = tempfile.mkdtemp()
+        class ManifestApp(DemoApp):
+            controller_manifest = os.path.join(self.dir, 'controllers.json')
+        self.app_class = ManifestApp
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.dir)
+
+    def test_build_manifest(self):
+        self.app_class().build_controller_manifest()
+        data = manifest.read_manifest(self.app_class.controller_manifest)
+        assert data['modules'] == {
+            'index': {'Index': 'hanabi.app.Controller'},
+            'hello': {'Index': 'hanabi.app.Controller',
+                      'World': 'hanabi.app.Controller'}}
+
+    def test_configure_from_manifest(self):
+        self.app_class().build_controller_manifest()
+        def no_scanning(self):
+            raise AssertionError('The controllers package was scanned')
+        self.app_class.find_controller_modules = no_scanning
+        app = self.app_class.create_app()
+        assert set(app.controllers.keys()) == set([
+            ('index', 'index'), ('hello', 'world'), ('hello', 'index')])
+
+    def test_ignore_stale_manifest(self):
+        manifest.write_manifest(self.app_class.controller_manifest, {
+            'signatures': {'.': [0, 0]},
+            'modules': {'hello': {'World': 'hanabi.app.Controller'}}})
+        app = self.app_class.create_app()
+        assert len(app.controllers) == 3
+
+
+class TestPrecompileTemplates(object):
+
+    def setup_method(self, method):
+        self.dir = tempfile.mkdtemp()
+        package_dir = os.path.join(self.dir, 'precompiled_app')
+        os.makedirs(os.path.join(package_dir, 'templates', 'hello'))
+        files = {'__init__.py': '',
+                 'templates/hello/world.html': '<p>{{ name }}</p>',
+                 'templates/hello/world.js': 'alert("{{ name }}");',
+                 'templates/hello/notes.txt': 'Not a template'}
+        for name, content in files.items():
+            with open(os.path.join(package_dir, name), 'w') as f:
+                f.write(content)
+        sys.path.insert(0, self.dir)
+        class PrecompiledApp(Application):
+            package = 'precompiled_app'
+            template_cache_dir = 'template-cache'
+        self.app_class = PrecompiledApp
+
+    def teardown_method(self, method):
+        sys.path.remove(self.dir)
+        sys.modules.pop('precompiled_app', None)
+        shutil.rmtree(self.dir)
+
+    def test_template_cache_dir(self):
+        app = self.app_class()
+        assert app.template_cache_path == os.path.join(
+            self.dir, 'precompiled_app', 'template-cache')
+        assert os.path.isdir(app.template_cache_path)
+
+    def test_precompile_templates(self):
+        app = self.app_class()
+        names = app.precompile_templates()
+        assert sorted(names) == ['hello/world.html', 'hello/world.js']
+        assert len(os.listdir(app.template_cache_path)) == 2
+
+
+def test_serve_static_files():
+    static_dir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(static_dir, 'app.js'), 'w') as f:
+            f.write('var app;')
+        app = DemoApp.create_app()
+        app.static_files = StaticFiles(static_dir)
+        client = Client(app, Response)
+        assert client.get('/static/app.js').data == 'var app;'
+        assert client.get('/static/missing.js').status_code == 404
+        assert client.get('/hello/world').data == 'Hello World!'
+    finally:
+        shutil.rmtree(static_dir)
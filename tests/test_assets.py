@@ -0,0 +1,93 @@
+#-*- x-counterpart: ../src/hanabi/assets.py; -*-
+import os
+import shutil
+import tempfile
+from jinja2 import Environment, DictLoader
+from hanabi import assets
+from hanabi import templateutils
+from hanabi.static import Fingerprints, FINGERPRINTS_NAME
+
+
+class TestBuildAssets(object):
+
+    def setup_method(self, method):
+        self.package_dir = tempfile.mkdtemp()
+        class FakeApp(object):
+            debug_mode = False
+            package_dir = self.package_dir
+        self.app = FakeApp()
+        self.app.templates = Environment(loader=DictLoader({
+            'index/index.html': '{{ js_include("a.js", "b.js") }}',
+            'index/other.html': '{{ js_include("a.js") }}'
+                                '{{ js_include(name) }}',
+            'index/notes.txt': '{{ js_include("c.js") }}'}))
+        self.app.templates.globals['js_include'] = (
+            templateutils.JavascriptInclude(self.app))
+        self.js_dir = os.path.join(self.package_dir, 'static', 'javascript')
+        os.makedirs(self.js_dir)
+        for name in ('a.js', 'b.js', 'c.js'):
+            with open(os.path.join(self.js_dir, name), 'w') as f:
+                f.write(name)
+        self.app.fingerprints = Fingerprints(
+            os.path.join(self.package_dir, 'static'))
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.package_dir)
+
+    def test_find_bundles(self):
+        assert assets.find_bundles(self.app.templates) == set([
+            ('js_include', ('a.js', 'b.js')),
+            ('js_include', ('a.js',))])
+
+    def test_build_assets(self):
+        data = assets.build_assets(self.app, [('js_include', ('c.js',))])
+        assert sorted(data['javascript'].keys()) == ['a.js', 'a.js,b.js', 'c.js']
+        for urls in data['javascript'].values():
+            path = os.path.join(self.package_dir, urls[0].lstrip('/'))
+            assert os.path.exists(path)
+
+    def test_helper_uses_manifest(self):
+        data = assets.build_assets(self.app)
+        # Without the sources only the manifest can be used
+        shutil.rmtree(self.js_dir)
+        helper = templateutils.JavascriptInclude(self.app)
+        assert helper.resource_urls('a.js', 'b.js') == (
+            data['javascript']['a.js,b.js'])
+
+    def test_minify_and_compress(self):
+        with open(os.path.join(self.js_dir, 'a.js'), 'w') as f:
+            f.write('// Comment\nvar a;\n')
+        urls = assets.build_assets(self.app)['javascript']['a.js']
+        path = os.path.join(self.package_dir, urls[0].lstrip('/'))
+        with open(path) as f:
+            assert f.read() == 'var a;'
+        assert os.path.exists(path + '.gz')
+
+    def test_build_without_minify(self):
+        data = assets.build_assets(self.app, minify=False, compress=False)
+        path = os.path.join(self.package_dir,
+                            data['javascript']['a.js'][0].lstrip('/'))
+        with open(path) as f:
+            assert f.read() == 'a.js\n'
+        assert not os.path.exists(path + '.gz')
+
+    def test_build_stylesheets_and_fingerprints(self):
+        self.app.templates.globals['css_include'] = (
+            templateutils.StylesheetInclude(self.app))
+        self.app.templates.loader.mapping['index/style.html'] = (
+            '{{ css_include("a.css") }}')
+        css_dir = os.path.join(self.package_dir, 'static', 'css')
+        os.makedirs(css_dir)
+        with open(os.path.join(css_dir, 'a.css'), 'w') as f:
+            f.write('a {\n    color: red;\n}\n')
+        data = assets.build_assets(self.app)
+        path = os.path.join(self.package_dir,
+                            data['css']['a.css'][0].lstrip('/'))
+        with open(path) as f:
+            assert f.read() == 'a{color: red;}'
+        cache_dir = os.path.join(self.package_dir, 'static', '_cache')
+        assert os.path.exists(os.path.join(cache_dir, FINGERPRINTS_NAME))
+        assert set(Fingerprints(
+            os.path.join(self.package_dir, 'static'))._stored) == set([
+            'javascript/a.js', 'javascript/b.js', 'javascript/c.js',
+            'css/a.css'])
@@ -0,0 +1,193 @@
+#-*- x-counterpart: ../src/hanabi/caching.py; -*-
+import os
+import shutil
+import tempfile
+from hanabi import Controller
+from hanabi import caching, manifest
+from werkzeug.test import Client
+from werkzeug import Response
+
+
+class App(object):
+    version = 1.2
+
+
+def make_entry(body):
+    return ('200 OK', [('Content-Type', 'text/html')], body)
+
+
+class TestMemoryBackend(object):
+
+    def test_get_and_set(self):
+        backend = caching.MemoryBackend()
+        assert backend.get('key') is None
+        backend.set('key', make_entry('body'), 60)
+        assert backend.get('key') == make_entry('body')
+        backend.delete('key')
+        assert backend.get('key') is None
+
+    def test_expire(self):
+        backend = caching.MemoryBackend()
+        backend.set('key', make_entry('body'), -1)
+        assert backend.get('key') is None
+        assert backend.size == 0
+
+    def test_evict_least_recently_used(self):
+        backend = caching.MemoryBackend(max_entries=2)
+        backend.set('a', make_entry('a'), 60)
+        backend.set('b', make_entry('b'), 60)
+        backend.get('a')
+        backend.set('c', make_entry('c'), 60)
+        assert backend.get('b') is None
+        assert backend.get('a') is not None
+        assert backend.get('c') is not None
+
+    def test_evict_on_size(self):
+        backend = caching.MemoryBackend(max_bytes=10)
+        backend.set('a', make_entry('a' * 6), 60)
+        backend.set('b', make_entry('b' * 6), 60)
+        assert backend.get('a') is None
+        assert backend.size == 6
+
+    def test_concurrent_access(self, concurrently):
+        backend = caching.MemoryBackend(max_entries=8)
+        def work(rnd):
+            for i in range(2000):
+                key = str(rnd.randint(0, 20))
+                action = rnd.random()
+                if action < 0.4:
+                    backend.set(key, make_entry(key * 3), 60)
+                elif action < 0.5:
+                    backend.delete(key)
+                else:
+                    entry = backend.get(key)
+                    assert entry is None or entry == make_entry(key * 3)
+        assert concurrently(work) == []
+        assert len(backend._entries) <= 8
+        assert backend.size == sum(len(entry[2]) for expires, entry
+                                   in backend._entries.values())
+
+
+class TestFileBackend(object):
+
+    def setup_method(self, method):
+        self.dir = tempfile.mkdtemp()
+        self.backend = caching.FileBackend(self.dir)
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.dir)
+
+    def test_shared_between_instances(self):
+        self.backend.set('key', make_entry('body'), 60)
+        assert caching.FileBackend(self.dir).get('key') == make_entry('body')
+
+    def test_expire_and_delete(self):
+        self.backend.set('old', make_entry('body'), -1)
+        assert self.backend.get('old') is None
+        self.backend.set('key', make_entry('body'), 60)
+        self.backend.clear()
+        assert self.backend.get('key') is None
+
+    def test_remove_expired_entry_on_get(self):
+        self.backend.set('old', make_entry('body'), -1)
+        assert os.listdir(self.dir) == ['old']
+        assert self.backend.get('old') is None
+        assert os.listdir(self.dir) == []
+
+    def test_prune(self):
+        backend = caching.FileBackend(self.dir, max_entries=2,
+                                      prune_interval=0)
+        backend.set('old', make_entry('body'), -1)
+        for key, ttl in (('a', 30), ('b', 60), ('c', 90)):
+            backend.set(key, make_entry('body'), ttl)
+        # The expired entry and the entry that expires first are removed
+        assert sorted(os.listdir(self.dir)) == ['b', 'c']
+
+    def test_prune_by_size(self):
+        backend = caching.FileBackend(self.dir, max_bytes=1000,
+                                      prune_interval=0)
+        backend.set('a', make_entry('x' * 600), 30)
+        backend.set('b', make_entry('x' * 600), 60)
+        assert os.listdir(self.dir) == ['b']
+
+    def test_ignore_invalid_entries(self):
+        with open(os.path.join(self.dir, 'key'), 'wb') as f:
+            f.write('\x80\x02cos\nsystem\n')
+        os.utime(os.path.join(self.dir, 'key'), (2 ** 31 - 1, 2 ** 31 - 1))
+        assert self.backend.get('key') is None
+
+    def test_prune_skips_entries_being_written(self):
+        temp_path = os.path.join(self.dir, manifest.TEMP_PREFIX + 'abc')
+        with open(temp_path, 'w') as f:
+            f.write('partial')
+        os.utime(temp_path, (1, 1))
+        self.backend.prune()
+        assert os.path.exists(temp_path)
+
+
+class Counter(Controller):
+    response_cache = caching.ResponseCache(ttl=60, vary=('Accept',))
+    calls = 0
+
+    def index(self, request):
+        self.calls += 1
+        return 'Call %d' % self.calls
+
+
+class TestResponseCache(object):
+
+    def setup_method(self, method):
+        Counter.response_cache.backend.clear()
+        self.controller = Counter(App())
+        self.client = Client(self.controller, Response)
+
+    def test_cache_get(self):
+        assert self.client.get('/').data == 'Call 1'
+        response = self.client.get('/')
+        assert response.data == 'Call 1'
+        assert response.content_type == 'text/html'
+
+    def test_key_includes_path_and_vary_headers(self):
+        self.client.get('/')
+        assert self.client.get('/?page=2').data == 'Call 2'
+        response = self.client.get('/', headers=[('Accept', 'text/plain')])
+        assert response.data == 'Call 3'
+
+    def test_vary_header(self):
+        assert self.client.get('/').headers['Vary'] == 'Accept'
+        assert self.client.get('/').headers['Vary'] == 'Accept'
+
+    def test_vary_header_is_extended(self):
+        class Negotiated(Counter):
+            def index(self, request):
+                return Response('body', headers=[('Vary', 'Cookie')])
+        client = Client(Negotiated(App()), Response)
+        for i in range(2):
+            assert client.get('/').headers['Vary'] == 'Cookie, Accept'
+
+    def test_key_includes_app_version(self):
+        self.client.get('/')
+        self.controller.app.version = 1.3
+        assert self.client.get('/').data == 'Call 2'
+
+    def test_do_not_cache_post(self):
+        self.client.post('/')
+        assert self.client.post('/').data == 'Call 2'
+
+    def test_do_not_cache_uncacheable_responses(self):
+        class NoStore(Counter):
+            def index(self, request):
+                return Response('body', headers=[('Cache-Control', 'no-store')])
+        assert not Counter.response_cache.is_cacheable(
+            NoStore(App()).respond(None))
+
+    def test_conditional_request_on_cached_response(self):
+        class Tagged(Counter):
+            def index(self, request):
+                response = Response('body')
+                response.set_etag('tag')
+                return response
+        client = Client(Tagged(App()), Response)
+        client.get('/')
+        response = client.get('/', headers=[('If-None-Match', '"tag"')])
+        assert response.status_code == 304
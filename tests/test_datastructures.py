@@ -0,0 +1,60 @@
+#-*- x-counterpart: ../src/hanabi/datastructures.py; -*-
+import pytest
+from hanabi.datastructures import LRUCache
+
+
+def test_get_and_set():
+    cache = LRUCache(10)
+    cache['a'] = 1
+    assert cache['a'] == 1
+    assert 'a' in cache
+    assert cache.get('b') is None
+    with pytest.raises(KeyError):
+        cache['b']
+
+
+def test_bounded_size():
+    cache = LRUCache(10)
+    for i in range(100):
+        cache[i] = i
+    assert len(cache) <= 10
+    assert 99 in cache
+    assert 0 not in cache
+
+
+def test_recently_used_items_survive():
+    cache = LRUCache(4)
+    cache['hot'] = 'value'
+    for i in range(20):
+        cache[i] = i
+        assert cache['hot'] == 'value'
+
+
+def test_delete_and_clear():
+    cache = LRUCache(4)
+    cache['a'] = 1
+    cache['b'] = 2
+    del cache['a']
+    assert 'a' not in cache
+    with pytest.raises(KeyError):
+        del cache['a']
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_concurrent_access(concurrently):
+    cache = LRUCache(16)
+    def work(rnd):
+        for i in range(5000):
+            key = rnd.randint(0, 40)
+            if rnd.random() < 0.3:
+                cache[key] = key * 2
+            elif rnd.random() < 0.5:
+                assert cache.get(key) in (None, key * 2)
+            else:
+                try:
+                    assert cache[key] == key * 2
+                except KeyError:
+                    pass
+    assert concurrently(work) == []
+    assert len(cache) <= 16
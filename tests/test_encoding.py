@@ -0,0 +1,113 @@
+#-*- x-counterpart: ../src/hanabi/encoding.py; -*-
+import datetime
+import decimal
+import uuid
+import pytest
+from hanabi import encoding
+
+
+def pytest_generate_tests(metafunc):
+    if 'backend' in metafunc.funcargnames:
+        for name in encoding.available_backends():
+            metafunc.addcall(funcargs=dict(backend=name))
+
+
+def test_stdlib_is_available():
+    assert 'json' in encoding.available_backends()
+    assert encoding.default_backend == encoding.available_backends()[0]
+
+
+def test_encode(backend):
+    encoder = encoding.get_encoder(backend)
+    assert encoder.encode({'artists': ['Hans Zimmer', 'Miles Davis']}) == (
+        '{"artists": ["Hans Zimmer", "Miles Davis"]}')
+    assert encoder.encode((1, 2.5, None, True)) == '[1, 2.5, null, true]'
+
+
+def test_encode_returns_ascii_bytes(backend):
+    encoded = encoding.get_encoder(backend).encode([u'caf\xe9'])
+    assert isinstance(encoded, str)
+    assert encoded == '["caf\\u00e9"]'
+
+
+def test_sort_keys(backend):
+    encoder = encoding.get_encoder(backend, sort_keys=True)
+    data = {'b': {'z': 1, 'y': 2}, 'a': [{'d': 1, 'c': 2}]}
+    assert encoder.encode(data) == (
+        '{"a": [{"c": 2, "d": 1}], "b": {"y": 2, "z": 1}}')
+
+
+def test_default_hook(backend):
+    encoder = encoding.get_encoder(backend)
+    data = [datetime.datetime(2012, 1, 2, 3, 4, 5),
+            datetime.date(2012, 1, 2),
+            decimal.Decimal('1.10'),
+            uuid.UUID('12345678123456781234567812345678')]
+    assert encoder.encode(data) == (
+        '["2012-01-02T03:04:05", "2012-01-02", "1.10",'
+        ' "12345678-1234-5678-1234-567812345678"]')
+    with pytest.raises(TypeError):
+        encoder.encode([object()])
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        encoding.get_encoder('does-not-exist')
+
+
+class TestRegistry(object):
+
+    def setup_method(self, method):
+        self.backends = list(encoding._backends)
+
+    def teardown_method(self, method):
+        encoding._backends[:] = self.backends
+
+    def test_prefer_high_priority(self):
+        class Encoder(object):
+            def encode(self, data):
+                return 'fast'
+        encoding.register_backend('fast', lambda s, d: Encoder(), 100)
+        assert encoding.available_backends()[0] == 'fast'
+        assert encoding.get_encoder().encode({}) == 'fast'
+
+    def test_skip_unavailable_backend(self):
+        def unavailable(sort_keys, default):
+            raise ImportError
+        encoding.register_backend('missing', unavailable, 100)
+        assert 'missing' not in encoding.available_backends()
+        assert encoding.get_encoder() is not None
+        with pytest.raises(ImportError):
+            encoding.get_encoder('missing')
+
+    def test_prefer_native_sorting(self):
+        class Encoder(object):
+            def __init__(self, name):
+                self.name = name
+        encoding.register_backend(
+            'unsorted', lambda s, d: Encoder('unsorted'), 100, False)
+        encoding.register_backend(
+            'sorted', lambda s, d: Encoder('sorted'), 50)
+        assert encoding.get_encoder().name == 'unsorted'
+        assert encoding.get_encoder(sort_keys=True).name == 'sorted'
+
+    def test_canonical_encoder_sorts_natively(self):
+        class Encoder(object):
+            def __init__(self, name, sort_keys):
+                self.name = name
+                self.sort_keys = sort_keys
+        encoding.register_backend(
+            'unsorted', lambda s, d: Encoder('unsorted', s), 100, False)
+        encoding.register_backend(
+            'sorted', lambda s, d: Encoder('sorted', s), 50)
+        encoder = encoding.get_canonical_encoder()
+        assert (encoder.name, encoder.sort_keys) == ('sorted', True)
+
+    def test_canonical_encoder_falls_back_to_unsorted(self):
+        def unavailable(sort_keys, default):
+            raise ImportError
+        encoding._backends[:] = []
+        encoding.register_backend('json', encoding.stdlib_backend,
+                                  sorts_natively=False)
+        encoding.register_backend('missing', unavailable)
+        assert not encoding.get_canonical_encoder().sort_keys
@@ -0,0 +1,131 @@
+#-*- x-counterpart: ../src/hanabi/instrumentation.py; -*-
+import logging
+import socket
+
+from hanabi import Application
+from hanabi.instrumentation import (TIMINGS_KEY, clock, server_timing,
+                                    Instrumentation, Histogram, HistogramSink,
+                                    LogSink, StatsdSink)
+from hanabi.request import Request
+from hanabi.rest import RESTController
+from werkzeug.test import Client, EnvironBuilder
+from werkzeug import Response
+
+
+class RecordingSink(object):
+    def __init__(self):
+        self.requests = []
+
+    def emit(self, timings):
+        self.requests.append(timings)
+
+
+class FakeApp(object):
+    version = 1
+
+
+class DemoApp(Application):
+    package = 'hanabi.examples.werkzeug'
+
+
+def names(timings):
+    return [name for name, duration in timings]
+
+
+def test_clock_is_monotonic():
+    first = clock()
+    assert clock() >= first
+
+
+def test_server_timing():
+    assert server_timing([('routing', 0.0015), ('request', 0.01)]) == \
+        'routing;dur=1.500, request;dur=10.000'
+
+
+def test_histogram_percentile():
+    histogram = Histogram((0.001, 0.01, 0.1))
+    assert histogram.percentile(50) is None
+    for duration in (0.0005, 0.0005, 0.005, 0.05, 0.5):
+        histogram.add(duration)
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.count == 5
+    assert histogram.percentile(40) == 0.001
+    assert histogram.percentile(50) == 0.01
+    assert histogram.percentile(100) == 0.5
+
+
+def test_histogram_sink():
+    sink = HistogramSink()
+    sink.emit([('routing', 0.001), ('request', 0.002)])
+    sink.emit([('request', 0.003)])
+    assert sink.histograms['routing'].count == 1
+    assert sink.histograms['request'].count == 2
+
+
+def test_log_sink():
+    records = []
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            records.append(record.getMessage())
+    sink = LogSink('hanabi.timing.test')
+    sink.logger.addHandler(Handler())
+    sink.logger.setLevel(logging.INFO)
+    sink.emit([('routing', 0.001)])
+    assert records == ['routing=1.000ms']
+
+
+def test_statsd_sink():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(1)
+    try:
+        sink = StatsdSink(port=receiver.getsockname()[1], prefix='test')
+        sink.emit([('routing', 0.001), ('request', 0.002)])
+        assert receiver.recv(1024) == \
+            'test.routing:1.000|ms\ntest.request:2.000|ms'
+    finally:
+        receiver.close()
+
+
+def test_statsd_sink_ignores_errors():
+    sink = StatsdSink(host='256.0.0.1')
+    sink.emit([('request', 0.001)])
+
+
+def test_application_records_spans():
+    sink = RecordingSink()
+    app = DemoApp.create_app()
+    app.instrumentation = Instrumentation([sink])
+    response = Client(app, Response).get('/')
+    assert response.status_code == 200
+    assert 'Server-Timing' not in response.headers
+    assert len(sink.requests) == 1
+    assert names(sink.requests[0]) == ['routing', 'dispatch', 'request']
+
+
+def test_server_timing_header_in_debug_mode():
+    sink = RecordingSink()
+    app = DemoApp.create_app()
+    app.debug_mode = True
+    app.instrumentation = Instrumentation([sink])
+    response = Client(app, Response).get('/')
+    assert 'routing;dur=' in response.headers['Server-Timing']
+    assert 'total;dur=' in response.headers['Server-Timing']
+
+
+def test_no_instrumentation_by_default():
+    app = DemoApp.create_app()
+    environ = EnvironBuilder('/').get_environ()
+    app(environ, lambda status, headers, exc_info=None: None)
+    assert TIMINGS_KEY not in environ
+
+
+def test_rest_response_spans():
+    class Items(RESTController):
+        pass
+    timings = []
+    environ = EnvironBuilder('/').get_environ()
+    environ[TIMINGS_KEY] = timings
+    Items(FakeApp()).response(Request(environ), {'a': 1})
+    assert names(timings) == ['json.encode', 'etag']
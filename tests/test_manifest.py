@@ -0,0 +1,53 @@
+#-*- x-counterpart: ../src/hanabi/manifest.py; -*-
+import os
+import pytest
+import shutil
+import tempfile
+from hanabi import manifest
+
+
+class TestManifest(object):
+
+    def setup_method(self, method):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'manifest.json')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.dir)
+
+    def test_read_missing_manifest(self):
+        assert manifest.read_manifest(self.path) is None
+
+    def test_write_and_read(self):
+        manifest.write_manifest(self.path, {'modules': {'a': ['A']}})
+        assert manifest.read_manifest(self.path) == {'modules': {'a': ['A']}}
+        assert os.listdir(self.dir) == ['manifest.json']
+
+    def test_is_fresh(self):
+        filename = os.path.join(self.dir, 'module.py')
+        with open(filename, 'w') as f:
+            f.write('a')
+        signatures = {'module.py': manifest.file_signature(filename)}
+        assert manifest.is_fresh(self.dir, signatures)
+        with open(filename, 'w') as f:
+            f.write('changed')
+        assert not manifest.is_fresh(self.dir, signatures)
+
+    def test_missing_file_is_not_fresh(self):
+        assert not manifest.is_fresh(self.dir, {'gone.py': [1.0, 1]})
+
+    def test_locked(self):
+        lock_path = os.path.join(self.dir, 'manifest.json.lock')
+        with manifest.locked(lock_path):
+            manifest.write_manifest(self.path, {})
+        assert os.path.exists(lock_path)
+        assert manifest.read_manifest(self.path) == {}
+
+    def test_written_files_are_readable_by_others(self):
+        manifest.write_manifest(self.path, {})
+        assert os.stat(self.path).st_mode & 0777 == 0644
+
+    def test_write_file_cleans_up(self):
+        with pytest.raises(TypeError):
+            manifest.write_file(self.path, object())
+        assert os.listdir(self.dir) == []
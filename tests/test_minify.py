@@ -0,0 +1,79 @@
+#-*- x-counterpart: ../src/hanabi/minify.py; -*-
+from hanabi.minify import minify_js, minify_css
+
+
+def test_remove_comments():
+    source = ('// A comment\n'
+              'var a = 1; // trailing\n'
+              '/* block\n comment */\n'
+              'var b = 2;')
+    assert minify_js(source) == 'var a = 1;\nvar b = 2;'
+
+
+def test_keep_license_comments():
+    assert minify_js('/*! License */\nvar a;') == '/*! License */\nvar a;'
+
+
+def test_collapse_whitespace():
+    source = '\n\nfunction test(a,   b) {\n    return a;\n}\n\n'
+    assert minify_js(source) == 'function test(a, b) {\nreturn a;\n}'
+
+
+def test_comment_separates_tokens():
+    assert minify_js('var/* comment */a;') == 'var a;'
+
+
+def test_keep_strings():
+    source = 'var a = "// not a comment", b = \'/* nor */ this\';'
+    assert minify_js(source) == source
+    source = 'var c = "escaped \\" //quote";'
+    assert minify_js(source) == source
+
+
+def test_keep_regular_expressions():
+    source = 'var re = /[/*]+\\/\\//g; x = a / b / c;'
+    assert minify_js(source) == source
+
+
+def test_regular_expression_after_keyword():
+    source = 'function f(s) { return /["\']/.test(s); }'
+    assert minify_js(source) == source
+    source = 'var returned = value /2; b = c / d;'
+    assert minify_js(source) == source
+
+
+def test_regular_expression_after_condition():
+    source = 'if (ok) /\\/\\//.test(s) && go();'
+    assert minify_js(source) == source
+    source = 'while (f(a)) /a"b/.exec(s);'
+    assert minify_js(source) == source
+    source = 'x = (a + b) / 2 / c; // half'
+    assert minify_js(source) == 'x = (a + b) / 2 / c;'
+
+
+def test_keep_ambiguous_slashes():
+    # After a brace or an increment a slash may start a regular expression
+    source = 'if (a) { b(); }  /x\\//.test(s);\nvar  c = i++  / 2;  // d\n'
+    assert minify_js(source) == (
+        'if (a) { b(); } /x\\//.test(s);\nvar c = i++ / 2;  // d')
+    # The next line starts without a known context
+    source = '} / 2 // half\n/a"//b/.test(s);'
+    assert minify_js(source) == source
+
+
+def test_keep_source_when_ambiguous_line_continues():
+    source = 'a = {} / 2; /* a\n  comment */\nvar  b;'
+    assert minify_js(source) == source
+
+
+def test_minify_css():
+    source = ('/*! License */\n'
+              '/* Links */\n'
+              'a:hover ,  p  > b {\n'
+              '    color : red;\n'
+              '    content: "  //  ";\n'
+              '}\n'
+              'div :first-child { margin: 0 auto }\n')
+    assert minify_css(source) == (
+        '/*! License */ a:hover,p > b{color : red;content: "  //  ";}'
+        'div :first-child{margin: 0 auto}')
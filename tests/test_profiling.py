@@ -0,0 +1,111 @@
+#-*- x-counterpart: ../src/hanabi/profiling.py; -*-
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from hanabi import Application, Controller
+from hanabi.profiling import SamplingProfiler, collapse_stack, route_key
+from werkzeug.test import Client
+from werkzeug import Response
+
+
+class DemoApp(Application):
+    package = 'hanabi.examples.werkzeug'
+
+
+class Slow(Controller):
+    delay = 0.05
+
+    def index(self, request):
+        self.wait()
+        return 'done'
+
+    def wait(self):
+        time.sleep(self.delay)
+
+
+def create_app(delay=0.05):
+    app = DemoApp.create_app()
+    app.register_controller('slowpages', 'Slow', Slow)
+    app.controllers[('slowpages', 'slow')].delay = delay
+    return app
+
+
+def test_route_key():
+    assert route_key(Slow(None)) == ('test_profiling', 'slow')
+
+
+def test_collapse_stack():
+    def inner():
+        return collapse_stack(sys._getframe())
+    stack = inner()
+    assert stack.endswith(';test_collapse_stack (test_profiling.py:%d)'
+                          ';inner (test_profiling.py:%d)' % (
+                              test_collapse_stack.func_code.co_firstlineno,
+                              inner.func_code.co_firstlineno))
+
+
+def test_collapse_stack_stops_at_code():
+    def inner():
+        stop_code = test_collapse_stack_stops_at_code.func_code
+        return collapse_stack(sys._getframe(), stop_code)
+    assert inner() == 'inner (test_profiling.py:%d)' % (
+        inner.func_code.co_firstlineno)
+
+
+def test_profiles_sampled_requests():
+    profiler = SamplingProfiler(create_app(), rate=1, interval=0.001)
+    response = Client(profiler, Response).get('/slowpages/slow')
+    assert response.data == 'done'
+    assert profiler.requests[('test_profiling', 'slow')] == 1
+    lines = profiler.collapsed(('test_profiling', 'slow'))
+    assert lines
+    wait = ';wait (test_profiling.py:%d)' % Slow.wait.func_code.co_firstlineno
+    assert any(wait in line for line in lines)
+    # The stacks start at the call into the application
+    assert all(line.startswith('__call__ (app.py:') for line in lines)
+
+
+def test_skips_requests_outside_rate():
+    profiler = SamplingProfiler(create_app(), rate=0)
+    Client(profiler, Response).get('/slowpages/slow')
+    assert not profiler.requests
+    assert profiler._sampler is None
+
+
+def test_threshold_keeps_slow_requests():
+    profiler = SamplingProfiler(create_app(delay=0), threshold=0.02,
+                                interval=0.001)
+    Client(profiler, Response).get('/slowpages/slow')
+    assert not profiler.stacks
+
+    profiler.app.controllers[('slowpages', 'slow')].delay = 0.05
+    Client(profiler, Response).get('/slowpages/slow')
+    assert profiler.requests[('test_profiling', 'slow')] == 1
+
+
+def test_unknown_route_passes_through():
+    profiler = SamplingProfiler(create_app(), rate=1)
+    client = Client(profiler, Response)
+    assert client.get('/static/does-not-exist').status_code == 404
+    assert not profiler.requests
+
+
+def test_dump():
+    profiler = SamplingProfiler(create_app(), rate=1, interval=0.001)
+    Client(profiler, Response).get('/slowpages/slow')
+    directory = tempfile.mkdtemp()
+    try:
+        paths = profiler.dump(os.path.join(directory, 'profiles'))
+        assert [os.path.basename(path) for path in paths] == [
+            'test_profiling.slow.folded']
+        with open(paths[0]) as fileobj:
+            for line in fileobj:
+                stack, count = line.rsplit(' ', 1)
+                assert int(count) > 0
+        profiler.reset()
+        assert not profiler.stacks
+    finally:
+        shutil.rmtree(directory)
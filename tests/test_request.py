@@ -30,3 +30,18 @@ class TestRequest(object):
         builder = EnvironBuilder()
         req = request.Request(builder.get_environ())
         assert isinstance(req.accept_mimetypes, request.MIMEAccept)
+
+    def test_accept_mimetypes_are_shared(self):
+        headers = [('Accept', 'text/html;q=0.9, text/javascript')]
+        req1 = request.Request(EnvironBuilder(headers=headers).get_environ())
+        req2 = request.Request(EnvironBuilder(headers=headers).get_environ())
+        assert req1.accept_mimetypes is req2.accept_mimetypes
+        assert req1.accept_mimetypes.accept_javascript
+
+
+def test_parse_accept_mimetypes():
+    accept = request.parse_accept_mimetypes('text/html, */*;q=0.1')
+    assert accept.best == 'text/html'
+    assert accept.accept_javascript
+    assert request.parse_accept_mimetypes('text/html, */*;q=0.1') is accept
+    assert not request.parse_accept_mimetypes(None).accept_javascript
@@ -1,5 +1,7 @@
 #-*- x-counterpart: ../src/hanabi/rest.py; -*-
+import json
 import pytest
+from hanabi import encoding
 from hanabi import RESTController
 from werkzeug.test import EnvironBuilder
 from werkzeug import Response
@@ -53,15 +55,26 @@ def test_dispatch_to_methods():
 
     controller = JSONTest(App())
 
-    checks = [('GET', '', '{"method": "list"}'),
-              ('GET', 'test', '{"method": "get", "id": "test"}'),
-              ('POST', '', '{"method": "create"}'),
-              ('DELETE', 'test', '{"method": "delete", "id": "test"}'),
-              ('PUT', 'test', '{"method": "update", "id": "test"}')]
+    checks = [('GET', '', {'method': 'list'}),
+              ('GET', 'test', {'method': 'get', 'id': 'test'}),
+              ('POST', '', {'method': 'create'}),
+              ('DELETE', 'test', {'method': 'delete', 'id': 'test'}),
+              ('PUT', 'test', {'method': 'update', 'id': 'test'})]
     for method, path, expected in checks:
         response = controller.dispatch(
             EnvironBuilder(method=method).get_request(), path)
-        assert response.response == [expected]
+        assert json.loads(response.get_data()) == expected
+
+
+@pytest.mark.skipif('simplejson' not in encoding.available_backends(),
+                    reason='no backend sorts keys natively')
+def test_sorted_keys_when_cheap():
+    class JSONTest(RESTController):
+        def get(self, request, id):
+            return {'b': 1, 'a': {'d': 2, 'c': 3}}
+    response = JSONTest(App()).dispatch(
+        EnvironBuilder().get_request(), 'test')
+    assert response.get_data() == '{"a": {"c": 3, "d": 2}, "b": 1}'
 
 
 class test_disallow_all_methods_by_default():
@@ -123,12 +136,37 @@ def test_get_response():
             EnvironBuilder().get_request(), 'id')
     # Must have a proper ETag
     assert response.status_code == 200
-    assert response.headers['ETag'] == '"56765472680401499c79732468ba4340"'
+    assert response.headers['ETag'] == '"c34db3e94c92072a13"'
     # Default caching policy
     assert response.headers['Cache-Control'] == 'must-revalidate'
     assert response.response == ['{"test": "testing"}']
 
 
+def test_content_etag_depends_on_data():
+    controller = RESTController(App())
+    req = EnvironBuilder().get_request()
+    tag1 = controller.response(req, {'a': [1, 2]}).headers['ETag']
+    tag2 = controller.response(req, {'a': [1, 3]}).headers['ETag']
+    assert tag1 != tag2
+
+
+def test_content_etag_uses_app_version():
+    app = App()
+    controller = RESTController(app)
+    tag1 = controller.content_etag('{}')
+    app.version = 2.0
+    tag2 = controller.content_etag('{}')
+    assert tag1 != tag2
+
+
+def test_content_etag_matches_body():
+    controller = RESTController(App())
+    req = EnvironBuilder().get_request()
+    response = controller.response(req, {'outer': {'b': 1, 'a': [1, 2]}})
+    assert response.headers['ETag'] == '"%s"' % controller.content_etag(
+        response.data)
+
+
 def test_get_with_matching_etag():
     class GETTest(RESTController):
 
@@ -137,10 +175,10 @@ def test_get_with_matching_etag():
 
     controller = GETTest(App)
     env = EnvironBuilder(
-        headers=[('If-None-Match', '"56765472680401499c79732468ba4340"')])
+        headers=[('If-None-Match', '"c34db3e94c92072a13"')])
     response = controller.dispatch(env.get_request(), 'id')
     assert response.status_code == 304
-    assert response.headers['ETag'] == '"56765472680401499c79732468ba4340"'
+    assert response.headers['ETag'] == '"c34db3e94c92072a13"'
     assert response.headers['Cache-Control'] == 'must-revalidate'
     assert response.response == []
 
@@ -187,5 +225,102 @@ def test_response_with_custom_etag():
     pass
 
 
+def test_matching_custom_etag_skips_encoding():
+    class Encoder(object):
+        calls = 0
+        def encode(self, data):
+            self.calls += 1
+            return '{}'
+    controller = RESTController(App())
+    controller.data_encoder = Encoder()
+    request = EnvironBuilder(
+        headers=[('If-None-Match', '"custom"')]).get_request()
+    response = controller.response(request, {}, etag='custom')
+    assert response.status_code == 304
+    assert response.headers['ETag'] == '"custom"'
+    assert controller.data_encoder.calls == 0
+    response = controller.response(request, {}, etag='other')
+    assert response.status_code == 200
+    assert response.get_data() == '{}'
+    assert controller.data_encoder.calls == 1
+
+
 def test_response_with_custom_caching_policy():
     pass
+
+
+class VersionedTest(RESTController):
+    calls = 0
+
+    def resource_version(self, request, id):
+        return 'v7'
+
+    def collection_version(self, request):
+        return 'v3'
+
+    def get(self, request, id):
+        self.calls += 1
+        return {'id': id}
+
+    def list(self, request):
+        self.calls += 1
+        return [1, 2, 3]
+
+
+def test_version_etag_short_circuit():
+    controller = VersionedTest(App())
+    etag = controller.etag(None, 'v7')
+    env = EnvironBuilder(headers=[('If-None-Match', '"%s"' % etag)])
+    response = controller.dispatch(env.get_request(), 'id')
+    assert response.status_code == 304
+    assert response.headers['ETag'] == '"%s"' % etag
+    assert controller.calls == 0
+
+
+def test_version_etag_miss():
+    controller = VersionedTest(App())
+    env = EnvironBuilder(headers=[('If-None-Match', '"outdated"')])
+    response = controller.dispatch(env.get_request(), '')
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"%s"' % controller.etag(None, 'v3')
+    assert response.data == '[1, 2, 3]'
+    assert controller.calls == 1
+
+
+class StreamingTest(RESTController):
+    stream_chunk_size = 10
+
+    def list(self, request):
+        for i in range(5):
+            yield {'id': i}
+
+
+def test_stream_list():
+    controller = StreamingTest(App())
+    response = controller.dispatch(EnvironBuilder().get_request(), '')
+    assert response.is_streamed
+    assert response.content_type == 'application/json'
+    assert 'ETag' not in response.headers
+    assert response.headers['Cache-Control'] == 'must-revalidate'
+    chunks = list(response.response)
+    assert len(chunks) == 3
+    assert ''.join(chunks) == (
+        '[{"id": 0}, {"id": 1}, {"id": 2}, {"id": 3}, {"id": 4}]')
+
+
+def test_stream_empty_list():
+    class EmptyTest(RESTController):
+        def list(self, request):
+            return iter([])
+    controller = EmptyTest(App())
+    response = controller.dispatch(EnvironBuilder().get_request(), '')
+    assert list(response.response) == ['[]']
+
+
+def test_stream_with_version_etag():
+    class VersionedStreamingTest(StreamingTest):
+        def collection_version(self, request):
+            return 'v1'
+    controller = VersionedStreamingTest(App())
+    response = controller.dispatch(EnvironBuilder().get_request(), '')
+    assert response.headers['ETag'] == '"%s"' % controller.etag(None, 'v1')
@@ -0,0 +1,100 @@
+#-*- x-counterpart: ../src/hanabi/routing.py; -*-
+import time
+import pytest
+from hanabi.routing import RouteTable, LazyControllers
+
+
+def make_table():
+    controllers = {
+        ('index', 'index'): 'index.Index',
+        ('wiki', 'index'): 'wiki.Index',
+        ('wiki', 'page'): 'wiki.Page'}
+    return RouteTable(controllers)
+
+
+def test_resolve_root():
+    routes = make_table()
+    assert routes.resolve('/') == ('index.Index', ())
+    assert routes.resolve('') == ('index.Index', ())
+
+
+def test_resolve_module_index():
+    assert make_table().resolve('/wiki') == ('wiki.Index', ())
+
+
+def test_resolve_named_class():
+    assert make_table().resolve('/wiki/page') == ('wiki.Page', ())
+
+
+def test_resolve_remaining_path():
+    routes = make_table()
+    assert routes.resolve('/wiki/page/45/edit') == ('wiki.Page', ('45/edit',))
+
+
+def test_resolve_unknown_class_to_module_index():
+    routes = make_table()
+    assert routes.resolve('/wiki/12') == ('wiki.Index', ('12',))
+    assert routes.resolve('/wiki/12/edit') == ('wiki.Index', ('12/edit',))
+
+
+def test_resolve_unknown_module():
+    routes = make_table()
+    with pytest.raises(KeyError):
+        routes.resolve('/does/not/exist')
+    with pytest.raises(KeyError):
+        routes.resolve('/nothing')
+
+
+def test_resolved_routes_are_cached():
+    routes = make_table()
+    routes.resolve('/wiki/page')
+    routes.controllers[('wiki', 'page')] = 'replaced'
+    assert routes.resolve('/wiki/page') == ('wiki.Page', ())
+    routes.clear()
+    assert routes.resolve('/wiki/page') == ('replaced', ())
+
+
+class TestLazyControllers(object):
+
+    def setup_method(self, method):
+        self.loaded = []
+        def loader(modulename):
+            self.loaded.append(modulename)
+            self.controllers[(modulename, 'index')] = modulename + '.Index'
+        self.controllers = LazyControllers(loader)
+        self.controllers.pending.update(['wiki', 'blog'])
+
+    def test_load_on_lookup(self):
+        assert self.controllers[('wiki', 'index')] == 'wiki.Index'
+        assert self.loaded == ['wiki']
+        assert self.controllers.pending == set(['blog'])
+
+    def test_load_once(self):
+        self.controllers[('wiki', 'index')]
+        with pytest.raises(KeyError):
+            self.controllers[('wiki', 'page')]
+        assert self.loaded == ['wiki']
+
+    def test_contains_and_get(self):
+        assert ('blog', 'index') in self.controllers
+        assert self.controllers.get(('wiki', 'index')) == 'wiki.Index'
+        assert self.controllers.get(('nothing', 'index')) is None
+        assert self.loaded == ['blog', 'wiki']
+
+    def test_resolve(self):
+        routes = RouteTable(self.controllers)
+        assert routes.resolve('/blog/12') == ('blog.Index', ('12',))
+        assert self.loaded == ['blog']
+
+    def test_load_once_from_many_threads(self, concurrently):
+        loader = self.controllers.loader
+        def slow_loader(modulename):
+            time.sleep(0.01)
+            loader(modulename)
+        self.controllers.loader = slow_loader
+        results = []
+        def lookup(rnd):
+            results.append(self.controllers[('wiki', 'index')])
+        assert concurrently(lookup) == []
+        assert results == ['wiki.Index'] * 8
+        assert self.loaded == ['wiki']
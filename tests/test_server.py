@@ -0,0 +1,152 @@
+#-*- x-counterpart: ../src/hanabi/server.py; -*-
+import os
+import signal
+import socket
+import threading
+import time
+import urllib2
+
+import pytest
+
+from hanabi.server import PreforkServer, Worker
+
+
+def pid_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid())]
+
+
+class RunningServer(object):
+    """Runs a server in a child process."""
+
+    def __init__(self, **options):
+        self.server = PreforkServer(lambda: pid_app, port=0, **options)
+        self.server.poll_interval = 0.05
+        self.server.bind()
+        self.url = 'http://127.0.0.1:%d/' % self.server.address[1]
+        self.pid = os.fork()
+        if not self.pid:
+            try:
+                self.server.run()
+            finally:
+                os._exit(0)
+        self.server.socket.close()
+
+    def get(self):
+        return urllib2.urlopen(self.url, timeout=5).read()
+
+    def stop(self):
+        os.kill(self.pid, signal.SIGTERM)
+        return os.waitpid(self.pid, 0)[1]
+
+
+@pytest.fixture
+def running(request):
+    servers = []
+
+    def start(**options):
+        server = RunningServer(**options)
+        servers.append(server)
+        return server
+
+    def stop():
+        for server in servers:
+            try:
+                server.stop()
+            except OSError:
+                pass
+    request.addfinalizer(stop)
+    return start
+
+
+def test_serve_requests(running):
+    server = running(workers=2, threads=2)
+    pids = set(server.get() for i in range(10))
+    assert 1 <= len(pids) <= 2
+    assert str(server.pid) not in pids
+    assert server.stop() == 0
+
+
+def test_max_requests(running):
+    server = running(workers=1, max_requests=2)
+    pids = [server.get() for i in range(6)]
+    assert pids[0] == pids[1]
+    assert len(set(pids)) == 3
+
+
+def test_reload(running):
+    server = running(workers=1)
+    before = server.get()
+    os.kill(server.pid, signal.SIGHUP)
+    deadline = time.time() + 5
+    while server.get() == before:
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert server.stop() == 0
+
+
+def test_reject_when_queue_is_full():
+    release = threading.Event()
+    def blocking_app(environ, start_response):
+        release.wait(5)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return ['done']
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+    listener.setblocking(0)
+    url = 'http://127.0.0.1:%d/' % listener.getsockname()[1]
+    worker = Worker(listener, blocking_app, threads=2, queue_size=1)
+    serving = threading.Thread(target=worker.serve)
+    serving.start()
+
+    statuses = []
+    def get():
+        try:
+            statuses.append(urllib2.urlopen(url, timeout=5).getcode())
+        except urllib2.HTTPError, e:
+            statuses.append(e.code)
+    clients = [threading.Thread(target=get) for i in range(6)]
+    try:
+        for client in clients:
+            client.start()
+        # At most two requests are handled and one is queued, the others
+        # are rejected right away.
+        deadline = time.time() + 5
+        while statuses.count(503) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        assert statuses.count(503) >= 3
+        release.set()
+        for client in clients:
+            client.join()
+    finally:
+        release.set()
+        worker.stopping.set()
+        serving.join()
+        listener.close()
+    assert sorted(set(statuses)) == [200, 503]
+    assert worker.server.handled + worker.server.rejected == 6
+
+
+def test_idle_connection_times_out():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+    listener.setblocking(0)
+    address = listener.getsockname()
+    worker = Worker(listener, pid_app, request_timeout=0.2)
+    serving = threading.Thread(target=worker.serve)
+    serving.start()
+    idle = socket.create_connection(address)
+    try:
+        # The only thread is blocked by the idle connection until it times
+        # out; then the next request is handled.
+        start = time.time()
+        url = 'http://127.0.0.1:%d/' % address[1]
+        assert urllib2.urlopen(url, timeout=5).read() == str(os.getpid())
+        assert time.time() - start < 2
+    finally:
+        idle.close()
+        worker.stopping.set()
+        serving.join()
+        listener.close()
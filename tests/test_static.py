@@ -0,0 +1,281 @@
+#-*- x-counterpart: ../src/hanabi/static.py; -*-
+import gzip
+import os
+import pytest
+import shutil
+import tempfile
+from cStringIO import StringIO
+from werkzeug.test import Client
+from werkzeug import Response
+from hanabi.static import StaticFiles, Fingerprints, FINGERPRINTS_NAME
+from hanabi.templateutils import gzip_compress
+
+BUNDLE_NAME = '9b1757704f9f7cbf3672b6ca786cc6a1.js'
+
+
+class TestStaticFiles(object):
+
+    def setup_method(self, method):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, 'javascript'))
+        with open(os.path.join(self.dir, 'javascript', 'a.js'), 'w') as f:
+            f.write('var a;')
+        with open(os.path.join(self.dir, 'b.js'), 'w') as f:
+            f.write('var b;')
+        with open(os.path.join(self.dir, 'b.js.gz'), 'w') as f:
+            f.write(gzip_compress('var b;'))
+        self.client = Client(StaticFiles(self.dir), Response)
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.dir)
+
+    def test_serve_file(self):
+        response = self.client.get('/javascript/a.js')
+        assert response.status_code == 200
+        assert response.data == 'var a;'
+        assert response.mimetype.endswith('/javascript')
+        assert response.content_length == 6
+        assert 'Vary' not in response.headers
+
+    def test_not_found(self):
+        assert self.client.get('/missing.js').status_code == 404
+        assert self.client.get('/javascript').status_code == 404
+        assert self.client.get('/../etc/passwd').status_code == 404
+
+    def test_serve_precompressed(self):
+        response = self.client.get('/b.js', headers=[
+            ('Accept-Encoding', 'gzip, deflate')])
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert response.mimetype.endswith('/javascript')
+        data = gzip.GzipFile(fileobj=StringIO(response.data)).read()
+        assert data == 'var b;'
+
+    def test_serve_uncompressed_without_gzip_support(self):
+        response = self.client.get('/b.js', headers=[
+            ('Accept-Encoding', 'gzip;q=0')])
+        assert 'Content-Encoding' not in response.headers
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert response.data == 'var b;'
+
+    def test_index(self):
+        static_files = StaticFiles(self.dir)
+        assert sorted(static_files.index.keys()) == [
+            'b.js', 'b.js.gz', 'javascript/a.js']
+        assert static_files.index['b.js'].size == 6
+
+    def test_index_files_added_later(self):
+        static_files = StaticFiles(self.dir)
+        with open(os.path.join(self.dir, 'c.js'), 'w') as f:
+            f.write('var c;')
+        assert 'c.js' not in static_files.index
+        client = Client(static_files, Response)
+        assert client.get('/c.js').data == 'var c;'
+        assert 'c.js' in static_files.index
+
+    def test_conditional_get(self):
+        response = self.client.get('/javascript/a.js')
+        etag = response.headers['ETag']
+        response = self.client.get('/javascript/a.js', headers=[
+            ('If-None-Match', etag)])
+        assert response.status_code == 304
+        assert response.data == ''
+
+    def test_cache_headers(self):
+        os.mkdir(os.path.join(self.dir, '_cache'))
+        with open(os.path.join(self.dir, '_cache', BUNDLE_NAME), 'w') as f:
+            f.write('var c;')
+        response = self.client.get('/_cache/' + BUNDLE_NAME)
+        assert response.headers['Cache-Control'] == (
+            'public, max-age=31536000, immutable')
+        response = self.client.get('/b.js')
+        assert response.headers['Cache-Control'] == 'public, max-age=3600'
+
+    def test_internal_files_are_not_served(self):
+        os.mkdir(os.path.join(self.dir, '_cache'))
+        for name in (BUNDLE_NAME, 'bundles.json', 'bundles.json.lock',
+                     FINGERPRINTS_NAME, 'tmpa1b2c3'):
+            with open(os.path.join(self.dir, '_cache', name), 'w') as f:
+                f.write('{}')
+        static_files = StaticFiles(self.dir)
+        assert sorted(key for key in static_files.index
+                      if key.startswith('_cache/')) == ['_cache/' + BUNDLE_NAME]
+        client = Client(static_files, Response)
+        assert client.get('/_cache/' + BUNDLE_NAME).status_code == 200
+        for name in ('bundles.json', 'bundles.json.lock', FINGERPRINTS_NAME,
+                     'tmpa1b2c3'):
+            assert client.get('/_cache/' + name).status_code == 404
+
+    def test_internal_files_are_not_served_through_other_paths(self):
+        os.mkdir(os.path.join(self.dir, '_cache'))
+        with open(os.path.join(self.dir, '_cache', 'bundles.json'), 'w') as f:
+            f.write('{}')
+        for path in ('/./_cache/bundles.json', '/_cache/./bundles.json',
+                     '/javascript/../_cache/bundles.json',
+                     '//_cache/bundles.json'):
+            assert self.client.get(path).status_code == 404
+
+    def test_index_normalized_paths(self):
+        static_files = StaticFiles(self.dir)
+        client = Client(static_files, Response)
+        for path in ('/./javascript/a.js', '/javascript/././a.js',
+                     '/b.js/../javascript/a.js'):
+            assert client.get(path).data == 'var a;'
+        assert sorted(static_files.index.keys()) == [
+            'b.js', 'b.js.gz', 'javascript/a.js']
+        assert client.get('/javascript/../../b.js').status_code == 404
+
+    def test_fingerprinted_files_are_immutable(self):
+        fingerprints = Fingerprints(self.dir)
+        client = Client(StaticFiles(self.dir, fingerprints), Response)
+        url = fingerprints.url('javascript/a.js')
+        assert url == '/static/javascript/a.js?v=' + fingerprints.fingerprint(
+            'javascript/a.js')
+        response = client.get(url[len('/static'):])
+        assert response.data == 'var a;'
+        assert response.headers['Cache-Control'] == (
+            'public, max-age=31536000, immutable')
+        # An outdated fingerprint must not be cached forever
+        response = client.get('/javascript/a.js?v=outdated')
+        assert response.headers['Cache-Control'] == 'public, max-age=3600'
+
+    def test_replaced_file_is_not_immutable_with_old_fingerprint(self):
+        fingerprints = Fingerprints(self.dir)
+        fingerprints.recheck_interval = 3600
+        client = Client(StaticFiles(self.dir, fingerprints), Response)
+        old_url = fingerprints.url('javascript/a.js')[len('/static'):]
+        assert 'immutable' in client.get(old_url).headers['Cache-Control']
+        path = os.path.join(self.dir, 'javascript', 'a.js')
+        with open(path, 'w') as f:
+            f.write('var replaced;')
+        response = client.get(old_url)
+        assert response.data == 'var replaced;'
+        assert response.headers['Cache-Control'] == 'public, max-age=3600'
+        new_url = fingerprints.url('javascript/a.js')[len('/static'):]
+        assert new_url != old_url
+        assert 'immutable' in client.get(new_url).headers['Cache-Control']
+
+    def test_range(self):
+        response = self.client.get('/javascript/a.js', headers=[
+            ('Range', 'bytes=1-3'), ('Accept-Encoding', 'gzip')])
+        assert response.status_code == 206
+        assert response.data == 'ar '
+        assert response.headers['Content-Range'] == 'bytes 1-3/6'
+        assert response.content_length == 3
+
+    def test_range_uses_uncompressed_file(self):
+        response = self.client.get('/b.js', headers=[
+            ('Range', 'bytes=4-'), ('Accept-Encoding', 'gzip')])
+        assert response.status_code == 206
+        assert response.data == 'b;'
+        assert 'Content-Encoding' not in response.headers
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get('/b.js', headers=[('Range', 'bytes=10-20')])
+        assert response.status_code == 416
+        assert response.headers['Content-Range'] == 'bytes */6'
+
+    def test_multiple_ranges_get_the_whole_file(self):
+        response = self.client.get('/b.js', headers=[
+            ('Range', 'bytes=0-1,4-5')])
+        assert response.status_code == 200
+        assert response.data == 'var b;'
+        assert 'Content-Range' not in response.headers
+
+    def test_replaced_file(self):
+        static_files = StaticFiles(self.dir)
+        client = Client(static_files, Response)
+        etag = client.get('/javascript/a.js').headers['ETag']
+        path = os.path.join(self.dir, 'javascript', 'a.js')
+        with open(path, 'w') as f:
+            f.write('var replaced;')
+        os.utime(path, (1, 1))
+        response = client.get('/javascript/a.js')
+        assert response.data == 'var replaced;'
+        assert response.content_length == 13
+        assert response.headers['ETag'] != etag
+        assert static_files.index['javascript/a.js'].size == 13
+
+    def test_remember_missing_compressed_copy(self, monkeypatch):
+        static_files = StaticFiles(self.dir)
+        client = Client(static_files, Response)
+        client.get('/javascript/a.js')
+        calls = []
+        def stat(path):
+            calls.append(path)
+            raise OSError(path)
+        monkeypatch.setattr(os, 'stat', stat)
+        assert client.get('/javascript/a.js').data == 'var a;'
+        assert client.get('/b.js', headers=[
+            ('Accept-Encoding', 'gzip')]).headers['Content-Encoding'] == 'gzip'
+        assert calls == []
+
+    def test_ignore_range_for_changed_file(self):
+        response = self.client.get('/b.js', headers=[
+            ('Range', 'bytes=4-'), ('If-Range', '"outdated"')])
+        assert response.status_code == 200
+        assert response.data == 'var b;'
+
+
+class TestFingerprints(object):
+
+    def setup_method(self, method):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, 'images'))
+        with open(os.path.join(self.dir, 'images', 'logo.png'), 'w') as f:
+            f.write('logo')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.dir)
+
+    def test_fingerprint(self):
+        fingerprints = Fingerprints(self.dir)
+        # The first characters of the MD5 hash of 'logo'
+        assert fingerprints.fingerprint('images/logo.png') == '96d6f2e7e1f7'
+        assert fingerprints.url('images/logo.png') == (
+            '/static/images/logo.png?v=96d6f2e7e1f7')
+
+    def test_missing_file(self):
+        fingerprints = Fingerprints(self.dir)
+        with pytest.raises(ValueError):
+            fingerprints.fingerprint('images/missing.png')
+        with pytest.raises(ValueError):
+            fingerprints.fingerprint('../outside.png')
+
+    def test_build_index(self):
+        os.mkdir(os.path.join(self.dir, '_cache'))
+        with open(os.path.join(self.dir, '_cache', 'abc.js'), 'w') as f:
+            f.write('var c;')
+        index = Fingerprints(self.dir).build()
+        assert index.keys() == ['images/logo.png']
+        assert os.path.exists(os.path.join(self.dir, '_cache',
+                                           FINGERPRINTS_NAME))
+
+    def test_use_index_without_reading_files(self):
+        Fingerprints(self.dir).build()
+        fingerprints = Fingerprints(self.dir)
+        fingerprints._stored['images/logo.png'][1] = 'fromtheindex'
+        assert fingerprints.fingerprint('images/logo.png') == 'fromtheindex'
+
+    def test_recheck_changed_file(self):
+        fingerprints = Fingerprints(self.dir)
+        fingerprints.recheck_interval = 0
+        assert fingerprints.fingerprint('images/logo.png') == '96d6f2e7e1f7'
+        with open(os.path.join(self.dir, 'images', 'logo.png'), 'w') as f:
+            f.write('new logo')
+        assert fingerprints.fingerprint('images/logo.png') != '96d6f2e7e1f7'
+
+    def test_no_recheck_within_interval(self):
+        fingerprints = Fingerprints(self.dir)
+        assert fingerprints.fingerprint('images/logo.png') == '96d6f2e7e1f7'
+        with open(os.path.join(self.dir, 'images', 'logo.png'), 'w') as f:
+            f.write('new logo')
+        assert fingerprints.fingerprint('images/logo.png') == '96d6f2e7e1f7'
+
+    def test_ignore_outdated_index(self):
+        fingerprints = Fingerprints(self.dir)
+        fingerprints.build()
+        with open(os.path.join(self.dir, 'images', 'logo.png'), 'w') as f:
+            f.write('new logo')
+        fingerprints = Fingerprints(self.dir)
+        assert fingerprints.fingerprint('images/logo.png') != '96d6f2e7e1f7'
@@ -3,9 +3,13 @@ from hanabi import TemplateController
 from hanabi.request import Request
 from werkzeug import BaseResponse
 from werkzeug.test import EnvironBuilder
+from jinja2 import Environment, DictLoader
 
 class FakeTemplateEnviron(object):
+    lookups = 0
+
     def get_template(self, template_name):
+        self.lookups += 1
         class Template(object):
             def render(self, *args, **kwargs):
                 return (template_name, args, kwargs)
@@ -13,7 +17,10 @@ class FakeTemplateEnviron(object):
 
 
 class FakeApp(object):
-    templates = FakeTemplateEnviron()
+    debug_mode = False
+
+    def __init__(self):
+        self.templates = FakeTemplateEnviron()
 
 
 class DummyController(TemplateController):
@@ -62,3 +69,47 @@ def test_render():
     response = controller.render_response(req, {'test': 'data'})
     assert response[0] == 'test_template/dummycontroller.html'
     assert response[2] == {'test': 'data'}
+
+def test_template_names():
+    controller = DummyController(FakeApp())
+    assert controller.html_template == 'test_template/dummycontroller.html'
+    assert controller.js_template == 'test_template/dummycontroller.js'
+
+def test_memoize_templates():
+    app = FakeApp()
+    controller = DummyController(app)
+    req = Request(EnvironBuilder().get_environ())
+    controller.render_response(req, {})
+    controller.render_response(req, {})
+    assert app.templates.lookups == 1
+
+def test_lookup_templates_in_debug_mode():
+    app = FakeApp()
+    app.debug_mode = True
+    controller = DummyController(app)
+    req = Request(EnvironBuilder().get_environ())
+    controller.render_response(req, {})
+    controller.render_response(req, {})
+    assert app.templates.lookups == 2
+
+class StreamingController(TemplateController):
+    stream_template = True
+    stream_buffer_size = 2
+
+    def index(self, request):
+        return {'items': range(5)}
+
+def test_stream_template():
+    class App(object):
+        debug_mode = False
+        templates = Environment(loader=DictLoader({
+            'test_template/streamingcontroller.html':
+                '{% for item in items %}<p>{{ item }}</p>{% endfor %}'}))
+    controller = StreamingController(App())
+    req = Request(EnvironBuilder().get_environ())
+    response = controller.dispatch(req)
+    assert response.is_streamed
+    assert response.mimetype == 'text/html'
+    chunks = list(response.iter_encoded())
+    assert len(chunks) > 1
+    assert ''.join(chunks) == ''.join('<p>%d</p>' % i for i in range(5))
@@ -3,8 +3,11 @@ import time
 import shutil
 import tempfile
 import os
+import random
 import pytest
+from jinja2 import Markup
 from hanabi import templateutils
+from hanabi.static import Fingerprints
 
 
 def test_urlfor_without_registered():
@@ -22,6 +25,29 @@ def test_url_for_with_args():
     url_for = templateutils.URLFor(FakeApp())
     url = url_for('peanut.Butter', 'jam', 'cheese')
     assert url == '/peanut/butter/jam/cheese'
+    assert url_for('peanut.Butter') == '/peanut/butter'
+    assert url_for('peanut.Butter', 12) == '/peanut/butter/12'
+
+def test_url_for_caches_prefix():
+    class FakeApp(object):
+        controllers = {('peanut', 'butter')}
+
+    url_for = templateutils.URLFor(FakeApp())
+    url_for('peanut.Butter')
+    FakeApp.controllers = set()
+    assert url_for('peanut.Butter', 1) == '/peanut/butter/1'
+    with pytest.raises(KeyError):
+        url_for('peanut.butter')
+
+def test_url_for_many():
+    class FakeApp(object):
+        controllers = {('peanut', 'butter')}
+
+    url_for = templateutils.URLFor(FakeApp())
+    assert url_for.many('peanut.Butter', [1, ('jam', 2), ()]) == [
+        '/peanut/butter/1', '/peanut/butter/jam/2', '/peanut/butter']
+    with pytest.raises(KeyError):
+        url_for.many('peanut.Jam', [1])
 
 
 
@@ -37,6 +63,40 @@ def test_js_escape():
         assert templateutils.js_escape(value) == expected
 
 
+def regex_js_escape(value):
+    # Straightforward implementation to compare js_escape with
+    def replace_js_pattern(match):
+        return templateutils.JS_ESCAPE_MAPPING[match.group(0)]
+    return templateutils.JS_REPLACEMENT_RE.sub(replace_js_pattern, unicode(value))
+
+
+def test_js_escape_matches_patterns():
+    random.seed(1)
+    alphabet = ['a', ' ', '<', '/', '\\', '\r', '\n', '"', "'", u'\xe9']
+    for i in range(2000):
+        value = ''.join(random.choice(alphabet)
+                        for j in range(random.randint(1, 12)))
+        assert templateutils.js_escape(value) == regex_js_escape(value)
+
+
+def test_js_escape_types():
+    assert templateutils.js_escape('') == ''
+    assert templateutils.js_escape(None) is None
+    assert templateutils.js_escape(12) == u'12'
+    escaped = templateutils.js_escape(Markup(u'<b>"plain"</b>'))
+    assert type(escaped) is unicode
+    assert escaped == u'<b>\\"plain\\"<\\/b>'
+    assert type(templateutils.js_escape('plain')) is unicode
+
+
+def test_js_escape_memo():
+    memo = {}
+    assert templateutils.js_escape('a "b"', memo) == r'a \"b\"'
+    assert memo == {'a "b"': r'a \"b\"'}
+    memo['a "b"'] = 'memoized'
+    assert templateutils.js_escape('a "b"', memo) == 'memoized'
+
+
 
 class TestResourceHelper(object):
 
@@ -130,6 +190,57 @@ class TestResourceHelper(object):
             '/static/js/a', '/static/js/b']
 
 
+    def test_cache_urls_in_debug(self):
+        self.app.debug_mode = True
+        urls = self.resource_helper.resource_urls('a', 'b')
+        assert self.resource_helper.resource_urls('a', 'b') is urls
+
+    def write_resources(self, *names):
+        for text in names:
+            with open(os.path.join(self.static_dir, text), 'w') as f:
+                f.write(text)
+
+    def test_reuse_bundle_from_index(self):
+        self.write_resources('a', 'b')
+        urls = self.resource_helper.resource_urls('a', 'b')
+        assert os.path.exists(os.path.join(
+            self.static_dir, '_cache', templateutils.BUNDLE_INDEX_NAME))
+
+        another_helper = templateutils.ResourceHelper(self.app)
+        def build_bundle(resources):
+            raise AssertionError('The bundle should not be built again')
+        another_helper.build_bundle = build_bundle
+        assert another_helper.resource_urls('a', 'b') == urls
+
+    def test_rebuild_missing_bundle(self):
+        self.write_resources('a')
+        urls = self.resource_helper.resource_urls('a')
+        os.remove(os.path.join(self.package_dir, urls[0].strip('/')))
+        another_helper = templateutils.ResourceHelper(self.app)
+        assert another_helper.resource_urls('a') == urls
+        assert os.path.exists(os.path.join(self.package_dir,
+                                           urls[0].strip('/')))
+
+    def test_recheck_changed_resources(self):
+        self.resource_helper.recheck_interval = 0
+        self.write_resources('a')
+        urls1 = self.resource_helper.resource_urls('a')
+        with open(os.path.join(self.static_dir, 'a'), 'w') as f:
+            f.write('changed')
+        urls2 = self.resource_helper.resource_urls('a')
+        assert urls1 != urls2
+        concatenated = os.path.join(self.package_dir, urls2[0].strip('/'))
+        with open(concatenated) as f:
+            assert f.read() == 'changed\n'
+
+    def test_no_recheck_within_interval(self):
+        self.write_resources('a')
+        urls1 = self.resource_helper.resource_urls('a')
+        with open(os.path.join(self.static_dir, 'a'), 'w') as f:
+            f.write('changed')
+        assert self.resource_helper.resource_urls('a') == urls1
+
+
 class TestJavascripInclude(object):
 
     def setup_method(self, method):
@@ -150,3 +261,106 @@ class TestJavascripInclude(object):
             '<script type="text/javascript"'
             ' src="/static/_cache/9b1757704f9f7cbf3672b6ca786cc6a1.js">'
             '</script>')
+
+
+class TestStaticHelpers(object):
+
+    def setup_method(self, method):
+        self.package_dir = tempfile.mkdtemp()
+        class FakeApp(object):
+            debug_mode = False
+            package_dir = self.package_dir
+        self.static_dir = os.path.join(self.package_dir, 'static')
+        for directory in ('css/theme', 'images', 'fonts'):
+            os.makedirs(os.path.join(self.static_dir, directory))
+        for name in ('images/logo.png', 'fonts/icons.eot', 'favicon.ico'):
+            with open(os.path.join(self.static_dir, name), 'w') as f:
+                f.write(name)
+        self.app = FakeApp()
+        self.app.fingerprints = Fingerprints(self.static_dir)
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.package_dir)
+
+    def fingerprinted(self, relpath):
+        return '/static/%s?v=%s' % (
+            relpath, self.app.fingerprints.fingerprint(relpath))
+
+    def test_image_tag(self):
+        image_tag = templateutils.ImageTag(self.app)
+        html = image_tag('logo.png', alt='A "logo"', class_='logo')
+        assert isinstance(html, Markup)
+        assert html == (
+            '<img alt="A &#34;logo&#34;" class="logo" src="%s">' %
+            self.fingerprinted('images/logo.png'))
+
+    def test_image_tag_in_debug(self):
+        self.app.debug_mode = True
+        image_tag = templateutils.ImageTag(self.app)
+        assert image_tag('logo.png') == '<img src="/static/images/logo.png">'
+
+    def test_favicon_link_tag(self):
+        favicon_link_tag = templateutils.FaviconLink(self.app)
+        assert favicon_link_tag() == (
+            '<link href="%s" rel="shortcut icon">' %
+            self.fingerprinted('favicon.ico'))
+
+    def test_stylesheet_bundle_rewrites_urls(self):
+        with open(os.path.join(self.static_dir, 'css/theme/a.css'), 'w') as f:
+            f.write('a { background: url(../../images/logo.png); }\n'
+                    '@font-face { src: url("../../fonts/icons.eot?#iefix"); }'
+                    '\nb { background: url(\'data:image/png;base64,AA\') }\n'
+                    'i { background: url(missing.png) }')
+        css_include = templateutils.StylesheetInclude(self.app)
+        html = css_include('theme/a.css')
+        url = html.split('href="')[1].split('"')[0]
+        assert url.startswith('/static/_cache/') and url.endswith('.css')
+        with open(os.path.join(self.package_dir, url.lstrip('/'))) as f:
+            assert f.read() == (
+                'a { background: url("%s"); }\n'
+                '@font-face { src: url("%s#iefix"); }\n'
+                'b { background: url("data:image/png;base64,AA") }\n'
+                'i { background: url("/static/css/theme/missing.png") }\n' % (
+                    self.fingerprinted('images/logo.png'),
+                    self.fingerprinted('fonts/icons.eot')))
+
+    def test_stylesheet_in_debug(self):
+        self.app.debug_mode = True
+        css_include = templateutils.StylesheetInclude(self.app)
+        assert css_include('a.css', 'b.css') == (
+            '<link rel="stylesheet" type="text/css" href="/static/css/a.css">'
+            '<link rel="stylesheet" type="text/css" href="/static/css/b.css">')
+
+    def write_stylesheet(self):
+        with open(os.path.join(self.static_dir, 'css/theme/a.css'), 'w') as f:
+            f.write('a { background: url(../../images/logo.png); }')
+
+    def test_stylesheet_bundle_depends_on_referenced_files(self):
+        self.write_stylesheet()
+        url1 = templateutils.StylesheetInclude(self.app)('theme/a.css')
+        logo = os.path.join(self.static_dir, 'images/logo.png')
+        with open(logo, 'w') as f:
+            f.write('another logo')
+        # A new process gets a new bundle with the new fingerprint
+        self.app.fingerprints = Fingerprints(self.static_dir)
+        css_include = templateutils.StylesheetInclude(self.app)
+        url2 = css_include('theme/a.css').split('href="')[1].split('"')[0]
+        assert url1 != url2
+        with open(os.path.join(self.package_dir, url2.lstrip('/'))) as f:
+            assert self.fingerprinted('images/logo.png') in f.read()
+
+    def test_recheck_referenced_files(self):
+        self.write_stylesheet()
+        css_include = templateutils.StylesheetInclude(self.app)
+        css_include.recheck_interval = 0
+        html1 = css_include('theme/a.css')
+        old_url = self.fingerprinted('images/logo.png')
+        with open(os.path.join(self.static_dir, 'images/logo.png'), 'w') as f:
+            f.write('another logo')
+        html2 = css_include('theme/a.css')
+        assert html1 != html2
+        new_url = self.fingerprinted('images/logo.png')
+        assert new_url != old_url
+        url = html2.split('href="')[1].split('"')[0]
+        with open(os.path.join(self.package_dir, url.lstrip('/'))) as f:
+            assert new_url in f.read()